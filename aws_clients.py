@@ -0,0 +1,110 @@
+import os
+import threading
+import time
+
+import boto3
+from botocore.config import Config
+
+from config import load_environment, REGION_NAME
+
+load_environment()
+
+# Connection tuning; can be overridden per deployment through the environment.
+MAX_POOL_CONNECTIONS = int(os.getenv("AWS_MAX_POOL_CONNECTIONS", "32"))
+MAX_ATTEMPTS = int(os.getenv("AWS_MAX_ATTEMPTS", "8"))
+CONNECT_TIMEOUT = 10
+READ_TIMEOUT = 120
+
+_lock = threading.Lock()
+_session = None
+_clients = {}
+_stats = {}
+
+
+def _client_config():
+    return Config(
+        max_pool_connections=MAX_POOL_CONNECTIONS,
+        tcp_keepalive=True,
+        connect_timeout=CONNECT_TIMEOUT,
+        read_timeout=READ_TIMEOUT,
+        retries={'mode': 'adaptive', 'max_attempts': MAX_ATTEMPTS},
+    )
+
+
+def _record(service_name, operation, elapsed, error):
+    key = f"{service_name}.{operation}"
+    with _lock:
+        entry = _stats.setdefault(key, {'calls': 0, 'errors': 0, 'total_seconds': 0.0, 'max_seconds': 0.0})
+        entry['calls'] += 1
+        entry['total_seconds'] += elapsed
+        entry['max_seconds'] = max(entry['max_seconds'], elapsed)
+        if error:
+            entry['errors'] += 1
+
+
+def _instrument(client, service_name):
+    """
+    Hooks the client's event system so every API call is counted and timed
+    (including any retries botocore performs for it).
+    """
+    def before_call(model, context, **kwargs):
+        context['_started_at'] = time.perf_counter()
+        # after-call-error is not given the operation model, so keep its name here.
+        context['_operation'] = model.name
+
+    def after_call(model, context, http_response, **kwargs):
+        started = context.pop('_started_at', None)
+        context.pop('_operation', None)
+        if started is not None:
+            # Fired before botocore raises ClientError, so throttles and other 4xx/5xx land here too.
+            _record(service_name, model.name, time.perf_counter() - started,
+                    error=http_response.status_code >= 300)
+
+    def after_call_error(context, **kwargs):
+        started = context.pop('_started_at', None)
+        operation = context.pop('_operation', 'unknown')
+        if started is not None:
+            _record(service_name, operation, time.perf_counter() - started, error=True)
+
+    client.meta.events.register('before-call', before_call)
+    client.meta.events.register('after-call', after_call)
+    client.meta.events.register('after-call-error', after_call_error)
+
+
+def get_client(service_name, region_name=REGION_NAME):
+    """
+    Returns a cached boto3 client for (service_name, region_name).
+    boto3 clients are thread-safe, so every stage shares the same client and
+    its pool of warm HTTPS connections instead of building a new one per call.
+    """
+    key = (service_name, region_name)
+    client = _clients.get(key)
+    if client is not None:
+        return client
+    global _session
+    with _lock:
+        client = _clients.get(key)
+        if client is None:
+            if _session is None:
+                _session = boto3.session.Session()
+            client = _session.client(service_name, region_name=region_name, config=_client_config())
+            _instrument(client, service_name)
+            _clients[key] = client
+    return client
+
+
+def get_client_stats():
+    """
+    Returns call counts and latency per "service.Operation", e.g.
+    {"bedrock-runtime.InvokeModel": {"calls": 4, "errors": 0, "avg_seconds": 3.2, ...}}
+    """
+    with _lock:
+        snapshot = {key: dict(value) for key, value in _stats.items()}
+    for value in snapshot.values():
+        value['avg_seconds'] = value['total_seconds'] / value['calls'] if value['calls'] else 0.0
+    return snapshot
+
+
+def reset_client_stats():
+    with _lock:
+        _stats.clear()
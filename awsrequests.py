@@ -1,21 +1,11 @@
-import boto3
 import json
 import logging
 from botocore.exceptions import ClientError
-import os
 from utils import get_video_model_input
-from dotenv import load_dotenv
+from aws_clients import get_client
+from config import load_environment
 
-load_dotenv()
-
-
-APIKEY = os.getenv("APIKEY")
-ACCESSKEY = os.getenv("ACCESSKEY")
-ELEVENLABS_APIKEY = os.getenv("ELEVENLABS_APIKEY")
-os.environ['ELEVENLABS_APIKEY'] = ELEVENLABS_APIKEY
-os.environ['AWS_ACCESS_KEY_ID'] = ACCESSKEY
-os.environ['AWS_SECRET_ACCESS_KEY'] = APIKEY
-os.environ['AWS_DEFAULT_REGION'] = 'us-east-1'
+load_environment()
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -37,8 +27,8 @@ def get_content_from_llm(prompt, model_id='us.anthropic.claude-3-5-haiku-2024102
     :return: The JSON response from the model.
     """
     try:
-        # Initialize the Bedrock runtime client
-        bedrock_runtime = boto3.client(service_name=SERVICE_NAME, region_name=REGION_NAME)
+        # Shared, pooled Bedrock runtime client
+        bedrock_runtime = get_client(SERVICE_NAME, REGION_NAME)
         
         # Build the JSON request body using the prompt as a user message
         body = json.dumps({
@@ -60,9 +50,9 @@ def get_content_from_llm(prompt, model_id='us.anthropic.claude-3-5-haiku-2024102
     
 
 
-def get_video(video_prompt):
-    model_input = get_video_model_input(video_prompt)
-    bedrock_runtime = boto3.client(service_name=SERVICE_NAME, region_name=REGION_NAME)
+def get_video(video_prompt, seed=None):
+    model_input = get_video_model_input(video_prompt, seed=seed)
+    bedrock_runtime = get_client(SERVICE_NAME, REGION_NAME)
     response = bedrock_runtime.start_async_invoke(
         modelId="amazon.nova-reel-v1:0",
         modelInput=model_input,
@@ -0,0 +1,365 @@
+"""
+HTTP load test for the FastAPI endpoints.
+
+Builds a synthetic saved_videos tree (sparse MP4 files, so 10k jobs cost
+little disk), starts the app with uvicorn in a subprocess and drives each
+endpoint with a local asyncio load generator. For every scenario it reports
+p50/p99 latency, throughput and how long the server's event loop was blocked.
+Responses other than 200/206 count as errors and are left out of the latency
+figures; the run exits 1 (and saves nothing) if the error rate is above
+--max-error-rate.
+
+    python benchmarks/http_bench.py --jobs 10000 --concurrency 500 --duration 15
+    python benchmarks/http_bench.py --save baseline.json
+    python benchmarks/http_bench.py --baseline baseline.json --max-regression 0.25
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SCENARIOS = ["home", "videos", "video_detail", "in_progress", "mp4_range"]
+OK_STATUSES = {200, 206}
+
+# Runs inside the server process: the app plus a probe that measures event-loop lag.
+SERVER_BOOTSTRAP = """
+import asyncio, sys, time
+import uvicorn
+import main
+
+LAG_INTERVAL = 0.005
+lag_samples = []
+
+async def monitor_loop_lag():
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(LAG_INTERVAL)
+        lag_samples.append(max(0.0, time.perf_counter() - start - LAG_INTERVAL))
+
+@main.app.on_event("startup")
+async def start_lag_monitor():
+    asyncio.get_running_loop().create_task(monitor_loop_lag())
+
+@main.app.get("/__bench/loop_lag")
+def loop_lag(reset: bool = False):
+    samples = sorted(lag_samples)
+    if reset:
+        lag_samples.clear()
+    if not samples:
+        return {"samples": 0, "max_ms": 0.0, "p99_ms": 0.0, "blocked_seconds": 0.0}
+    return {
+        "samples": len(samples),
+        "max_ms": samples[-1] * 1000,
+        "p99_ms": samples[min(len(samples) - 1, int(len(samples) * 0.99))] * 1000,
+        # Time the loop could not run callbacks, counting only stalls above 1 ms.
+        "blocked_seconds": sum(s for s in samples if s > 0.001),
+    }
+
+uvicorn.run(main.app, host="127.0.0.1", port=int(sys.argv[1]), log_level="warning")
+"""
+
+
+def build_tree(root, jobs, video_size):
+    """
+    Creates root/saved_videos with `jobs` finished jobs and links static/ and templates/.
+    Returns the list of job ids.
+    """
+    saved_videos = os.path.join(root, "saved_videos")
+    os.makedirs(saved_videos, exist_ok=True)
+    quiz = {"questions": [{"start_time": 0, "end_time": 30, "question": "Soru?",
+                           "options": ["A", "B", "C", "D", "E"], "answer": "C"}] * 3}
+    quiz_json = json.dumps(quiz)
+    ids = []
+    for i in range(jobs):
+        video_id = uuid.uuid4().hex
+        job_dir = os.path.join(saved_videos, video_id)
+        os.makedirs(job_dir)
+        with open(os.path.join(job_dir, "prompt.txt"), "w", encoding="utf-8") as f:
+            f.write(f"Sentetik konu {i}: hücre bölünmesi ve mitoz evreleri")
+        with open(os.path.join(job_dir, "quiz.json"), "w", encoding="utf-8") as f:
+            f.write(quiz_json)
+        with open(os.path.join(job_dir, "preview.jpg"), "wb") as f:
+            f.write(b"\xff\xd8\xff" + b"\0" * 20000)
+        with open(os.path.join(job_dir, "final_vid.mp4"), "wb") as f:
+            f.truncate(video_size)  # Sparse: real size on the wire, almost none on disk.
+        ids.append(video_id)
+    for name in ("static", "templates"):
+        os.symlink(os.path.join(REPO_ROOT, name), os.path.join(root, name))
+    return ids
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+class Connection:
+    """
+    Minimal keep-alive HTTP/1.1 client on asyncio streams (GET only).
+    """
+
+    def __init__(self, host, port):
+        self.host, self.port = host, port
+        self.reader = self.writer = None
+
+    async def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            try:
+                await self.writer.wait_closed()
+            except (ConnectionError, OSError):
+                pass
+        self.reader = self.writer = None
+
+    async def get(self, path, headers=None, keep_body=False):
+        """
+        Sends a GET and reads the whole response. Returns (status, body_bytes, body),
+        where body is only kept when keep_body is set.
+        """
+        if self.writer is None:
+            self.reader, self.writer = await asyncio.open_connection(self.host, self.port)
+        lines = [f"GET {path} HTTP/1.1", f"Host: {self.host}:{self.port}", "Connection: keep-alive"]
+        lines += [f"{k}: {v}" for k, v in (headers or {}).items()]
+        self.writer.write(("\r\n".join(lines) + "\r\n\r\n").encode("ascii"))
+        await self.writer.drain()
+
+        status_line = await self.reader.readline()
+        if not status_line:
+            raise ConnectionError("Server closed the connection")
+        status = int(status_line.split()[1])
+        response_headers = {}
+        while True:
+            line = await self.reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            key, _, value = line.decode("latin-1").partition(":")
+            response_headers[key.strip().lower()] = value.strip()
+
+        received = 0
+        body = []
+        if response_headers.get("transfer-encoding", "").lower() == "chunked":
+            while True:
+                size = int((await self.reader.readline()).split(b";")[0], 16)
+                if size == 0:
+                    await self.reader.readline()
+                    break
+                chunk = await self.reader.readexactly(size)
+                received += len(chunk)
+                if keep_body:
+                    body.append(chunk)
+                await self.reader.readline()
+        else:
+            remaining = int(response_headers.get("content-length", 0))
+            while remaining:
+                chunk = await self.reader.read(min(remaining, 1 << 16))
+                if not chunk:
+                    raise ConnectionError("Truncated response body")
+                received += len(chunk)
+                remaining -= len(chunk)
+                if keep_body:
+                    body.append(chunk)
+        if response_headers.get("connection", "").lower() == "close":
+            await self.close()
+        return status, received, (b"".join(body) if keep_body else None)
+
+
+def request_for(scenario, ids, video_size, range_size):
+    if scenario == "home":
+        return "/", None
+    if scenario == "videos":
+        return "/videos", None
+    if scenario == "video_detail":
+        return f"/videos/{random.choice(ids)}", None
+    if scenario == "in_progress":
+        return "/in_progress", None
+    start = random.randrange(0, max(1, video_size - range_size))
+    return (f"/saved_videos/{random.choice(ids)}/final_vid.mp4",
+            {"Range": f"bytes={start}-{start + range_size - 1}"})
+
+
+async def run_scenario(port, scenario, ids, concurrency, duration, video_size, range_size):
+    latencies = []
+    statuses = {}
+    errors = 0
+    received_bytes = 0
+    deadline = time.perf_counter() + duration
+
+    async def user():
+        nonlocal errors, received_bytes
+        conn = Connection("127.0.0.1", port)
+        try:
+            while time.perf_counter() < deadline:
+                path, headers = request_for(scenario, ids, video_size, range_size)
+                started = time.perf_counter()
+                try:
+                    status, size, _ = await conn.get(path, headers)
+                except (ConnectionError, OSError, asyncio.IncompleteReadError, ValueError, IndexError):
+                    errors += 1
+                    await conn.close()
+                    continue
+                statuses[status] = statuses.get(status, 0) + 1
+                if status not in OK_STATUSES:
+                    errors += 1
+                    continue
+                latencies.append(time.perf_counter() - started)
+                received_bytes += size
+        finally:
+            await conn.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(user() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+
+    def percentile(p):
+        return latencies[min(len(latencies) - 1, int(len(latencies) * p))] * 1000 if latencies else 0.0
+
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "error_rate": errors / (len(latencies) + errors) if latencies or errors else 0.0,
+        "statuses": {str(k): v for k, v in sorted(statuses.items())},
+        "p50_ms": percentile(0.50),
+        "p99_ms": percentile(0.99),
+        "mean_ms": statistics.mean(latencies) * 1000 if latencies else 0.0,
+        "rps": len(latencies) / elapsed,
+        "mb_per_s": received_bytes / elapsed / 1024 ** 2,
+    }
+
+
+async def fetch_json(port, path):
+    conn = Connection("127.0.0.1", port)
+    try:
+        _, _, body = await conn.get(path, keep_body=True)
+    finally:
+        await conn.close()
+    return json.loads(body)
+
+
+async def wait_until_ready(port, process, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError("Server exited during startup")
+        try:
+            conn = Connection("127.0.0.1", port)
+            status, _, _ = await conn.get("/in_progress")
+            await conn.close()
+            if status == 200:
+                return
+        except (ConnectionError, OSError):
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError("Server did not become ready")
+
+
+async def run(args, port, ids):
+    await wait_until_ready(port, args.process)
+    results = {}
+    for scenario in args.scenarios:
+        # Warm up caches and connections, then reset the loop-lag probe.
+        await run_scenario(port, scenario, ids, min(args.concurrency, 10), 1.0, args.video_size, args.range_size)
+        await fetch_json(port, "/__bench/loop_lag?reset=true")
+        result = await run_scenario(port, scenario, ids, args.concurrency, args.duration,
+                                    args.video_size, args.range_size)
+        result["loop_lag"] = await fetch_json(port, "/__bench/loop_lag?reset=true")
+        results[scenario] = result
+        lag = result["loop_lag"]
+        print(f"{scenario:13s} {result['requests']:7d} req  {result['errors']:4d} err  "
+              f"p50 {result['p50_ms']:8.1f} ms  p99 {result['p99_ms']:8.1f} ms  "
+              f"{result['rps']:8.1f} req/s  {result['mb_per_s']:7.1f} MB/s  "
+              f"loop blocked {lag['blocked_seconds']:.2f} s (max {lag['max_ms']:.1f} ms)  "
+              f"statuses {result['statuses']}")
+    return results
+
+
+def check_errors(results, max_error_rate, label=""):
+    failed = False
+    for scenario, result in results.items():
+        if result.get("error_rate", 0.0) > max_error_rate or not result["requests"]:
+            print(f"ERRORS {label}{scenario}: {result['errors']} failed requests "
+                  f"({result.get('error_rate', 0.0):.1%}), statuses {result.get('statuses')}")
+            failed = True
+    return failed
+
+
+def compare(results, baseline, max_regression, max_error_rate=0.0):
+    # Latencies of a run (or baseline) full of errors say nothing about the endpoints.
+    failed = check_errors(results, max_error_rate)
+    failed = check_errors(baseline, max_error_rate, label="baseline ") or failed
+    for scenario, result in results.items():
+        base = baseline.get(scenario)
+        if not base:
+            continue
+        for metric in ("p50_ms", "p99_ms"):
+            if base[metric] and result[metric] > base[metric] * (1 + max_regression):
+                print(f"REGRESSION {scenario} {metric}: {base[metric]:.1f} -> {result[metric]:.1f} ms")
+                failed = True
+        if base["rps"] and result["rps"] < base["rps"] * (1 - max_regression):
+            print(f"REGRESSION {scenario} rps: {base['rps']:.1f} -> {result['rps']:.1f}")
+            failed = True
+    return failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load-test the FastAPI endpoints against a synthetic saved_videos tree.")
+    parser.add_argument("--jobs", type=int, default=10000, help="Synthetic saved jobs to create.")
+    parser.add_argument("--concurrency", type=int, default=100, help="Concurrent keep-alive clients.")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds per scenario.")
+    parser.add_argument("--video-size-mb", type=float, default=20.0)
+    parser.add_argument("--range-kb", type=int, default=1024, help="Bytes per ranged MP4 request.")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--save", help="Write the results as JSON to this file.")
+    parser.add_argument("--baseline", help="JSON results to compare against.")
+    parser.add_argument("--max-regression", type=float, default=0.25,
+                        help="Allowed relative slowdown against the baseline before failing.")
+    parser.add_argument("--max-error-rate", type=float, default=0.0,
+                        help="Allowed fraction of failed or non-200/206 requests per scenario.")
+    parser.add_argument("--keep-tree", action="store_true", help="Do not delete the synthetic tree.")
+    args = parser.parse_args()
+    args.scenarios = [s for s in args.scenarios.split(",") if s]
+    args.video_size = int(args.video_size_mb * 1024 ** 2)
+    args.range_size = args.range_kb * 1024
+
+    root = tempfile.mkdtemp(prefix="http_bench_")
+    print(f"Building {args.jobs} synthetic jobs in {root} ...")
+    ids = build_tree(root, args.jobs, args.video_size)
+
+    port = free_port()
+    env = dict(os.environ, PYTHONPATH=REPO_ROOT + os.pathsep + os.environ.get("PYTHONPATH", ""),
+               STORAGE_SWEEPER="0", PROMPT_LOG=os.path.join(root, "prompt_log.jsonl"))
+    args.process = subprocess.Popen([sys.executable, "-c", SERVER_BOOTSTRAP, str(port)], cwd=root, env=env)
+    try:
+        results = asyncio.run(run(args, port, ids))
+    finally:
+        args.process.terminate()
+        args.process.wait()
+        if not args.keep_tree:
+            shutil.rmtree(root, ignore_errors=True)
+
+    if check_errors(results, args.max_error_rate):
+        # Never keep a run with failing endpoints as a baseline.
+        sys.exit(1)
+    if args.save:
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        sys.exit(1 if compare(results, baseline, args.max_regression, args.max_error_rate) else 0)
+
+
+if __name__ == "__main__":
+    main()
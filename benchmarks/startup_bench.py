@@ -0,0 +1,75 @@
+"""
+Startup benchmark for the web process.
+
+Imports `main` in a fresh interpreter several times and reports the import
+wall time and peak RSS. Exits non-zero if either budget is exceeded or if any
+of the heavy pipeline modules were loaded at import time.
+
+    python benchmarks/startup_bench.py --runs 5 --max-seconds 1.5 --max-rss-mb 120
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules that must only be imported once a generation job runs.
+HEAVY_MODULES = ["cv2", "pydub", "elevenlabs", "boto3", "botocore",
+                 "aws_clients", "utils", "awsrequests", "video_script", "process_subs"]
+
+PROBE = """
+import json, resource, sys, time
+start = time.perf_counter()
+import main
+elapsed = time.perf_counter() - start
+rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+if sys.platform == "darwin":
+    rss_kb //= 1024
+heavy = [m for m in %r if m in sys.modules]
+print(json.dumps({"seconds": elapsed, "rss_mb": rss_kb / 1024.0, "heavy": heavy}))
+""" % (HEAVY_MODULES,)
+
+
+def run_probe():
+    result = subprocess.run([sys.executable, "-c", PROBE], cwd=REPO_ROOT,
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                            text=True, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure import time and RSS of the web process.")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--max-seconds", type=float, default=1.5,
+                        help="Budget for the median import time of `main`.")
+    parser.add_argument("--max-rss-mb", type=float, default=120.0,
+                        help="Budget for the peak RSS after importing `main`.")
+    args = parser.parse_args()
+
+    samples = [run_probe() for _ in range(args.runs)]
+    seconds = statistics.median(s["seconds"] for s in samples)
+    rss_mb = max(s["rss_mb"] for s in samples)
+    heavy = sorted({m for s in samples for m in s["heavy"]})
+
+    print(f"import main: median {seconds * 1000:.1f} ms over {args.runs} runs "
+          f"(budget {args.max_seconds * 1000:.0f} ms)")
+    print(f"peak RSS: {rss_mb:.1f} MB (budget {args.max_rss_mb:.0f} MB)")
+
+    failed = False
+    if heavy:
+        print("FAIL: heavy modules imported at startup:", ", ".join(heavy))
+        failed = True
+    if seconds > args.max_seconds:
+        print("FAIL: import time over budget")
+        failed = True
+    if rss_mb > args.max_rss_mb:
+        print("FAIL: RSS over budget")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
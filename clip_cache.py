@@ -0,0 +1,138 @@
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Where downloaded Nova Reel clips are kept between jobs, and how much disk they may use.
+CLIP_CACHE_DIR = os.getenv("CLIP_CACHE_DIR", "clip_cache")
+CLIP_CACHE_MAX_BYTES = int(os.getenv("CLIP_CACHE_MAX_BYTES", str(5 * 1024 ** 3)))
+
+
+def clip_key(video_prompt, duration, fps, dimension, seed):
+    """
+    Cache key for a generated clip: every input that changes Nova Reel's output.
+    """
+    payload = json.dumps([video_prompt, duration, fps, dimension, seed], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def link_or_copy(src, dst):
+    """
+    Hard-links src to dst, falling back to a copy across filesystems.
+    """
+    os.makedirs(os.path.dirname(dst), exist_ok=True)
+    if os.path.exists(dst):
+        os.remove(dst)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+class ClipCache:
+    """
+    Content-addressed store for downloaded output.mp4 clips.
+
+    Layout under root:
+      blobs/<sha256 of file>.mp4   the clip itself, shared by every key with identical content
+      keys/<clip_key>              text file holding the blob hash for that generation config
+
+    Blobs are evicted least-recently-used (by mtime, refreshed on every hit) once
+    the total size exceeds max_bytes.
+    """
+
+    def __init__(self, root=CLIP_CACHE_DIR, max_bytes=CLIP_CACHE_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self.blobs_dir = os.path.join(root, "blobs")
+        self.keys_dir = os.path.join(root, "keys")
+        self._lock = threading.Lock()
+        os.makedirs(self.blobs_dir, exist_ok=True)
+        os.makedirs(self.keys_dir, exist_ok=True)
+
+    def _blob_path(self, content_hash):
+        return os.path.join(self.blobs_dir, f"{content_hash}.mp4")
+
+    def lookup(self, key):
+        """
+        Returns the cached blob path for key, or None on a miss.
+        """
+        key_path = os.path.join(self.keys_dir, key)
+        try:
+            with open(key_path, "r", encoding="utf-8") as f:
+                content_hash = f.read().strip()
+        except FileNotFoundError:
+            return None
+        blob_path = self._blob_path(content_hash)
+        if not os.path.exists(blob_path):
+            # Blob was evicted; drop the dangling key.
+            try:
+                os.remove(key_path)
+            except FileNotFoundError:
+                pass
+            return None
+        os.utime(blob_path)
+        return blob_path
+
+    def fetch(self, key, dst):
+        """
+        Links the cached clip for key to dst. Returns True on a hit.
+        """
+        blob_path = self.lookup(key)
+        if blob_path is None:
+            return False
+        link_or_copy(blob_path, dst)
+        logger.info("Clip cache hit %s -> %s", key[:12], dst)
+        return True
+
+    def store(self, key, src):
+        """
+        Adds the clip at src under key and evicts old clips if over the size cap.
+        """
+        content_hash = _file_sha256(src)
+        blob_path = self._blob_path(content_hash)
+        with self._lock:
+            if not os.path.exists(blob_path):
+                tmp_path = blob_path + ".tmp"
+                link_or_copy(src, tmp_path)
+                os.replace(tmp_path, blob_path)
+            key_path = os.path.join(self.keys_dir, key)
+            with open(key_path + ".tmp", "w", encoding="utf-8") as f:
+                f.write(content_hash)
+            os.replace(key_path + ".tmp", key_path)
+            os.utime(blob_path)
+            self._evict()
+        logger.info("Stored clip %s as blob %s", key[:12], content_hash[:12])
+        return blob_path
+
+    def _evict(self):
+        entries = []
+        total = 0
+        for name in os.listdir(self.blobs_dir):
+            if not name.endswith(".mp4"):
+                continue
+            path = os.path.join(self.blobs_dir, name)
+            st = os.stat(path)
+            entries.append((st.st_mtime, st.st_size, path))
+            total += st.st_size
+        if total <= self.max_bytes:
+            return
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            os.remove(path)
+            total -= size
+            logger.info("Evicted cached clip %s (%d bytes)", path, size)
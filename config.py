@@ -0,0 +1,30 @@
+import os
+
+from dotenv import load_dotenv
+
+REGION_NAME = 'us-east-1'
+
+_env_loaded = False
+
+
+def load_environment():
+    """
+    Loads the .env file once per process and maps our own key names onto the
+    variable names expected by boto3 and ElevenLabs.
+    Safe to call from every module; only the first call does any work.
+    """
+    global _env_loaded
+    if _env_loaded:
+        return
+    load_dotenv()
+
+    env_map = {
+        'ELEVENLABS_APIKEY': os.getenv("ELEVENLABS_APIKEY"),
+        'AWS_ACCESS_KEY_ID': os.getenv("ACCESSKEY"),
+        'AWS_SECRET_ACCESS_KEY': os.getenv("APIKEY"),
+    }
+    for key, value in env_map.items():
+        if value:
+            os.environ[key] = value
+    os.environ['AWS_DEFAULT_REGION'] = REGION_NAME
+    _env_loaded = True
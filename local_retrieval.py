@@ -0,0 +1,292 @@
+import argparse
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+import numpy as np
+
+from aws_clients import get_client
+from config import load_environment, REGION_NAME
+
+load_environment()
+
+logger = logging.getLogger(__name__)
+
+LOCAL_INDEX_DIR = os.getenv("LOCAL_INDEX_DIR", "local_index")
+EMBEDDING_MODEL_ID = os.getenv("EMBEDDING_MODEL_ID", "amazon.titan-embed-text-v2:0")
+EMBEDDING_DIMENSIONS = 1024
+# Titan accepts ~50k characters; chunks are far shorter, this only guards odd inputs.
+MAX_EMBED_CHARS = 20000
+EMBED_WORKERS = 8
+
+
+def embed_text(text):
+    """
+    Returns the normalized Titan embedding of text as a float32 vector.
+    """
+    body = json.dumps({
+        'inputText': text[:MAX_EMBED_CHARS],
+        'dimensions': EMBEDDING_DIMENSIONS,
+        'normalize': True,
+    })
+    response = get_client('bedrock-runtime', REGION_NAME).invoke_model(body=body, modelId=EMBEDDING_MODEL_ID)
+    embedding = json.loads(response.get('body').read())['embedding']
+    return np.asarray(embedding, dtype=np.float32)
+
+
+def embed_texts(texts):
+    if not texts:
+        return np.zeros((0, EMBEDDING_DIMENSIONS), dtype=np.float32)
+    with ThreadPoolExecutor(max_workers=min(EMBED_WORKERS, len(texts))) as pool:
+        return np.vstack(list(pool.map(embed_text, texts)))
+
+
+def _chunk_id(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class LocalVectorIndex:
+    """
+    Append-only local vector index for knowledge base chunks.
+
+    Layout under root:
+      embeddings.f32   raw float32 matrix (N x dim), L2-normalized rows, memory-mapped for queries
+      chunks.jsonl     one {"id", "text"} record per row, in the same order
+      meta.json        {"dim", "model_id"} so an index is never mixed across embedding models
+      .lock            flock'ed by writers (exclusive) and refreshing readers (shared)
+
+    New chunks are appended to both files, so updates are incremental and
+    readers only need to re-map the matrix. Several processes (web server,
+    scheduler) may share one index: writers re-read both files under the
+    lock before appending, and readers pick up rows added by others.
+    """
+
+    def __init__(self, root=LOCAL_INDEX_DIR, dim=EMBEDDING_DIMENSIONS, model_id=EMBEDDING_MODEL_ID):
+        self.root = root
+        self.dim = dim
+        self.model_id = model_id
+        self.embeddings_path = os.path.join(root, "embeddings.f32")
+        self.chunks_path = os.path.join(root, "chunks.jsonl")
+        self.meta_path = os.path.join(root, "meta.json")
+        self.lock_path = os.path.join(root, ".lock")
+        self._row_bytes = dim * np.dtype(np.float32).itemsize
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+        self._texts = []
+        self._ids = set()
+        # Byte offset in chunks.jsonl up to which records are loaded.
+        self._chunks_offset = 0
+        self._matrix = np.zeros((0, dim), dtype=np.float32)
+        with self._lock, self._file_lock(fcntl.LOCK_EX):
+            self._check_meta()
+            self._refresh()
+
+    def _check_meta(self):
+        meta = {"dim": self.dim, "model_id": self.model_id}
+        if os.path.exists(self.meta_path):
+            with open(self.meta_path, "r", encoding="utf-8") as f:
+                existing = json.load(f)
+            if existing != meta:
+                raise ValueError(f"Local index at {self.root} was built with {existing}, expected {meta}.")
+        else:
+            with open(self.meta_path, "w", encoding="utf-8") as f:
+                json.dump(meta, f)
+
+    @contextmanager
+    def _file_lock(self, mode):
+        with open(self.lock_path, "a") as lock_file:
+            fcntl.flock(lock_file, mode)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _refresh(self):
+        """
+        Loads chunk records appended since the last call (by any process) and
+        re-maps the matrix. Call with self._lock and the file lock held.
+        """
+        if not os.path.exists(self.chunks_path):
+            return
+        with open(self.chunks_path, "rb") as f:
+            f.seek(self._chunks_offset)
+            data = f.read()
+        # Only whole lines; a writer may be in the middle of appending the last one.
+        complete = data[:data.rfind(b"\n") + 1]
+        if not complete:
+            return
+        for line in complete.splitlines():
+            record = json.loads(line)
+            self._texts.append(record["text"])
+            self._ids.add(record["id"])
+        self._chunks_offset += len(complete)
+        self._remap()
+
+    def _embedding_rows(self):
+        try:
+            return os.path.getsize(self.embeddings_path) // self._row_bytes
+        except FileNotFoundError:
+            return 0
+
+    def _remap(self):
+        rows = len(self._texts)
+        if self._embedding_rows() < rows:
+            raise ValueError(f"Local index at {self.root} has fewer embeddings than chunks.")
+        if rows == 0:
+            self._matrix = np.zeros((0, self.dim), dtype=np.float32)
+            return
+        self._matrix = np.memmap(self.embeddings_path, dtype=np.float32, mode="r", shape=(rows, self.dim))
+
+    def __len__(self):
+        return len(self._texts)
+
+    def add(self, texts, embeddings=None):
+        """
+        Appends chunks that are not in the index yet. Embeddings are computed
+        with Titan unless given (e.g. from a bulk export); given embeddings must
+        be one self.dim-wide row per text from self.model_id. Returns the number added.
+        """
+        if embeddings is not None:
+            embeddings = np.asarray(embeddings, dtype=np.float32)
+            if embeddings.ndim != 2 or embeddings.shape != (len(texts), self.dim):
+                raise ValueError(f"Expected {len(texts)} embeddings of dimension {self.dim}, "
+                                 f"got an array of shape {embeddings.shape}.")
+        with self._lock:
+            with self._file_lock(fcntl.LOCK_SH):
+                self._refresh()
+            new = self._new_chunks(texts)
+        if not new:
+            return 0
+        # Embed without holding any lock, so queries in this process and writers
+        # in other processes are not held up by Titan calls.
+        if embeddings is None:
+            vectors = embed_texts([text for _, _, text in new])
+        else:
+            vectors = embeddings[[i for i, _, _ in new]]
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors = (vectors / np.maximum(norms, 1e-12)).astype(np.float32)
+
+        with self._lock, self._file_lock(fcntl.LOCK_EX):
+            # Another thread or process may have appended meanwhile; re-read the
+            # files and drop chunks it already added.
+            self._refresh()
+            keep = [j for j, (_, chunk_id, _) in enumerate(new) if chunk_id not in self._ids]
+            new = [new[j] for j in keep]
+            vectors = vectors[keep]
+            if new:
+                rows = len(self._texts)
+                # Embeddings first: a writer that crashes between the two writes leaves
+                # rows without chunk records. Only such orphans lie past `rows` while
+                # the lock is held, so they are cut off before appending.
+                with open(self.embeddings_path, "ab") as f:
+                    if self._embedding_rows() > rows:
+                        f.truncate(rows * self._row_bytes)
+                    f.write(vectors.tobytes())
+                with open(self.chunks_path, "a", encoding="utf-8") as f:
+                    for _, chunk_id, text in new:
+                        f.write(json.dumps({"id": chunk_id, "text": text}, ensure_ascii=False) + "\n")
+                self._refresh()
+        if new:
+            logger.info("Added %d chunks to local index (%d total)", len(new), len(self._texts))
+        return len(new)
+
+    def _new_chunks(self, texts):
+        new = []
+        seen = set()
+        for i, text in enumerate(texts):
+            chunk_id = _chunk_id(text)
+            if chunk_id in self._ids or chunk_id in seen:
+                continue
+            seen.add(chunk_id)
+            new.append((i, chunk_id, text))
+        return new
+
+    def search(self, query_vector, k=10):
+        """
+        Returns up to k (score, text) pairs by cosine similarity, best first.
+        """
+        matrix = self._matrix
+        if matrix.shape[0] == 0:
+            return []
+        query_vector = np.asarray(query_vector, dtype=np.float32)
+        query_vector = query_vector / max(float(np.linalg.norm(query_vector)), 1e-12)
+        scores = matrix @ query_vector
+        k = min(k, scores.shape[0])
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(float(scores[i]), self._texts[i]) for i in top]
+
+    def query(self, text, k=10):
+        vector = embed_text(text)
+        # Pick up chunks other processes added since the last query.
+        with self._lock, self._file_lock(fcntl.LOCK_SH):
+            self._refresh()
+        return self.search(vector, k)
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_local_index():
+    """
+    Returns the process-wide index, opening it on first use.
+    """
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = LocalVectorIndex()
+    return _index
+
+
+def import_export(path, index):
+    """
+    Bulk-loads a JSONL export of {"text": ..., "embedding": [...], "model_id": ...} records
+    (embedding and model_id optional). Embeddings are used only if every record has one
+    and none names a model other than the index's (EMBEDDING_MODEL_ID); otherwise the
+    texts are re-embedded with Titan.
+    """
+    texts, vectors, models = [], [], set()
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            texts.append(record["text"])
+            vectors.append(record.get("embedding"))
+            models.add(record.get("model_id", index.model_id))
+    if models - {index.model_id}:
+        logger.warning("Export has embeddings from %s, re-embedding with %s",
+                       sorted(models - {index.model_id}), index.model_id)
+    elif texts and all(v is not None for v in vectors):
+        return index.add(texts, embeddings=vectors)
+    return index.add(texts)
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description="Manage the local knowledge base vector index.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    import_parser = sub.add_parser("import", help="Load a JSONL export of chunks into the index.")
+    import_parser.add_argument("path")
+    query_parser = sub.add_parser("query", help="Run a top-k query against the index.")
+    query_parser.add_argument("text")
+    query_parser.add_argument("-k", type=int, default=10)
+    sub.add_parser("stats", help="Print the number of indexed chunks.")
+    args = parser.parse_args()
+
+    index = get_local_index()
+    if args.command == "import":
+        print(f"Added {import_export(args.path, index)} chunks ({len(index)} total).")
+    elif args.command == "query":
+        for score, text in index.query(args.text, args.k):
+            print(f"{score:.3f}  {text[:120]!r}")
+    else:
+        print(f"{len(index)} chunks in {index.root}")
@@ -0,0 +1,164 @@
+"""
+Reads duration, dimensions and frame count of MP4 files straight from the
+`moov` box headers (mvhd/tkhd/mdhd/stsz), without spawning ffprobe or
+setting up a decoder. Results are memoized per (path, size, mtime).
+"""
+import json
+import os
+import struct
+import subprocess
+import threading
+from collections import namedtuple
+
+MediaInfo = namedtuple("MediaInfo", ["duration", "timescale", "width", "height", "frame_count", "fps"])
+
+# Containers that only hold other boxes; everything else is skipped by size.
+_CONTAINER_BOXES = {b"moov", b"trak", b"mdia", b"minf", b"stbl"}
+
+
+class MediaParseError(ValueError):
+    pass
+
+
+def _iter_boxes(f, start, end):
+    """
+    Yields (type, payload_offset, payload_size) for the boxes in [start, end).
+    """
+    offset = start
+    while offset + 8 <= end:
+        f.seek(offset)
+        header = f.read(8)
+        if len(header) < 8:
+            return
+        size, box_type = struct.unpack(">I4s", header)
+        header_size = 8
+        if size == 1:
+            size = struct.unpack(">Q", f.read(8))[0]
+            header_size = 16
+        elif size == 0:
+            size = end - offset
+        if size < header_size or offset + size > end:
+            raise MediaParseError(f"Corrupt box {box_type!r} at offset {offset}")
+        yield box_type, offset + header_size, size - header_size
+        offset += size
+
+
+def _read(f, offset, size):
+    f.seek(offset)
+    data = f.read(size)
+    if len(data) < size:
+        raise MediaParseError("Unexpected end of file")
+    return data
+
+
+def _parse_time_header(data):
+    """
+    (timescale, duration) from an mvhd or mdhd payload.
+    """
+    version = data[0]
+    if version == 1:
+        timescale, duration = struct.unpack(">IQ", data[20:32])
+    else:
+        timescale, duration = struct.unpack(">II", data[12:20])
+    return timescale, duration
+
+
+def _parse_track(f, start, end):
+    track = {}
+    for box_type, offset, size in _iter_boxes(f, start, end):
+        if box_type == b"tkhd":
+            data = _read(f, offset, size)
+            base = 88 if data[0] == 1 else 76
+            width, height = struct.unpack(">II", data[base:base + 8])
+            track["width"], track["height"] = width >> 16, height >> 16
+        elif box_type == b"mdhd":
+            track["timescale"], track["duration"] = _parse_time_header(_read(f, offset, min(size, 32)))
+        elif box_type == b"hdlr":
+            # The mdia handler comes first; QuickTime also puts a data handler in minf.
+            track.setdefault("handler", _read(f, offset, 12)[8:12])
+        elif box_type == b"stsz":
+            sample_size, sample_count = struct.unpack(">II", _read(f, offset + 4, 8))
+            track["frame_count"] = sample_count
+        elif box_type in _CONTAINER_BOXES:
+            for key, value in _parse_track(f, offset, offset + size).items():
+                track.setdefault(key, value)
+    return track
+
+
+def parse_mp4(path):
+    """
+    Parses the MP4 headers of path into a MediaInfo. Raises MediaParseError
+    if there is no moov box or no video track.
+    """
+    file_size = os.path.getsize(path)
+    with open(path, "rb") as f:
+        for box_type, offset, size in _iter_boxes(f, 0, file_size):
+            if box_type != b"moov":
+                continue
+            timescale = duration = None
+            video = None
+            for child, child_offset, child_size in _iter_boxes(f, offset, offset + size):
+                if child == b"mvhd":
+                    timescale, duration = _parse_time_header(_read(f, child_offset, min(child_size, 32)))
+                elif child == b"trak":
+                    track = _parse_track(f, child_offset, child_offset + child_size)
+                    if track.get("handler") == b"vide" and video is None:
+                        video = track
+            if not timescale or video is None:
+                raise MediaParseError(f"No movie header or video track in {path}")
+            frame_count = video.get("frame_count", 0)
+            if not duration or not frame_count:
+                # Fragmented MP4: samples live in moof boxes, not in the moov tables.
+                raise MediaParseError(f"No sample tables in moov of {path}")
+            track_seconds = video["duration"] / video["timescale"] if video.get("timescale") else 0
+            fps = frame_count / track_seconds if track_seconds else 0.0
+            return MediaInfo(duration / timescale, timescale, video.get("width", 0),
+                             video.get("height", 0), frame_count, fps)
+    raise MediaParseError(f"No moov box in {path}")
+
+
+def probe_ffprobe(path):
+    """
+    Fallback for files the header parser cannot handle (e.g. fragmented MP4).
+    """
+    command = [
+        "ffprobe", "-v", "error", "-select_streams", "v:0",
+        "-show_entries", "format=duration:stream=width,height,nb_frames,r_frame_rate",
+        "-of", "json", path,
+    ]
+    result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, check=True)
+    info = json.loads(result.stdout)
+    stream = (info.get("streams") or [{}])[0]
+    numerator, _, denominator = stream.get("r_frame_rate", "0/1").partition("/")
+    fps = float(numerator) / float(denominator or 1) if float(denominator or 1) else 0.0
+    return MediaInfo(float(info["format"]["duration"]), 0, int(stream.get("width", 0)),
+                     int(stream.get("height", 0)), int(stream.get("nb_frames", 0) or 0), fps)
+
+
+_CACHE_MAX_ENTRIES = 4096
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def get_media_info(path):
+    """
+    Memoized media info for path; re-read only when the file's size or mtime changes.
+    """
+    st = os.stat(path)
+    key = (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+    info = _cache.get(key)
+    if info is not None:
+        return info
+    try:
+        info = parse_mp4(path)
+    except MediaParseError:
+        info = probe_ffprobe(path)
+    with _cache_lock:
+        if len(_cache) >= _CACHE_MAX_ENTRIES:
+            _cache.clear()
+        _cache[key] = info
+    return info
+
+
+def get_video_duration(path):
+    return get_media_info(path).duration
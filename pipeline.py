@@ -0,0 +1,177 @@
+"""
+The video-generation pipeline: script and quiz, Nova Reel clips, narration
+and the final render. Used by the web app (main.py) and the off-peak
+scheduler (scheduler.py) without either importing the other.
+"""
+import os
+import time
+import logging
+import shutil
+import json
+
+from config import load_environment
+from scratch import scratch_workspace, estimate_job_bytes
+
+load_environment()
+
+def generate_video(prompt: str, output_dir: str, work_dir: str = None):
+    """
+    Executes the complete video-generation pipeline:
+      1. Creates output directories.
+      2. Saves the prompt.
+      3. Generates the video script (and quiz) from the prompt; raises ScriptGenerationError if they fail validation.
+      4. Saves the quiz (video_quiz) as quiz.json in the output folder.
+      5. For each video script entry, it links a cached clip (deterministic-seed mode) or requests
+         a video part, and waits until all requested parts are ready.
+      6. Downloads each video part into output_dir/parts.
+      7. Moves the downloaded parts so that they appear as video_000, video_001, etc.
+      8. Calls ultimate_pipeline(video_script, output_dir, work_dir) which writes subtitles and renders
+         the final video and preview in a single ffmpeg pass (at "<work_dir>/videos/final_vid.mp4").
+         Without a work_dir, a scratch workspace is used (tmpfs when it has room, see scratch.py).
+      9. Moves the final video and its preview image (written during rendering) into output_dir.
+      10. Deletes temporary folders ("videos" and "audio_files") under work_dir.
+    """
+    # The pipeline modules pull in boto3 and the ElevenLabs SDK; import them
+    # here so the web process starts with only FastAPI loaded.
+    import utils
+    from utils import check_job_status, download_s3_prefix
+    from clip_cache import ClipCache, clip_key
+    from awsrequests import get_video
+    from video_script import get_video_script_and_quiz  # Returns (video_script, video_quiz)
+
+    logging.info("Creating output directory at %s", output_dir)
+    os.makedirs(output_dir, exist_ok=True)
+    parts_dir = os.path.join(output_dir, "parts")
+    os.makedirs(parts_dir, exist_ok=True)
+    
+    # Save the prompt for later listing.
+    prompt_file = os.path.join(output_dir, "prompt.txt")
+    with open(prompt_file, "w", encoding="utf-8") as f:
+        f.write(prompt)
+    logging.info("Saved prompt to %s", prompt_file)
+    
+    # Generate video script (and quiz) from the prompt.
+    logging.info("Generating video script for prompt: %s", prompt)
+    video_script, video_quiz = get_video_script_and_quiz(prompt)
+    # video_script = video_script[:2]
+    
+    # Save the quiz into quiz.json in the output folder.
+    quiz_file = os.path.join(output_dir, "quiz.json")
+    with open(quiz_file, "w", encoding="utf-8") as f:
+        json.dump(video_quiz, f)
+    logging.info("Saved quiz to %s", quiz_file)
+    
+    clip_cache = ClipCache() if utils.DETERMINISTIC_SEED else None
+
+    video_responses = []  # Will store details for each video part.
+    for index, video_script_item in enumerate(video_script):
+        video_prompt = video_script_item['video_prompt']
+        seed = utils.get_video_seed(video_prompt)
+        video_script_item['part_index'] = index
+        video_script_item['clip_key'] = clip_key(video_prompt, utils.VIDEO_DURATION, utils.VIDEO_FPS,
+                                                 utils.VIDEO_DIMENSION, seed)
+        if clip_cache is not None:
+            cached_path = os.path.join(output_dir, f"video_{index:03d}", "output.mp4")
+            if clip_cache.fetch(video_script_item['clip_key'], cached_path):
+                logging.info("Video part %d served from clip cache", index)
+                continue
+        logging.info("Requesting video part %d with prompt: %s", index, video_prompt)
+        video_response = get_video(video_prompt, seed=seed)
+        time.sleep(5)  # Optional delay between requests.
+        video_script_item['video_response'] = video_response
+        video_script_item['invocation_arn'] = video_response["invocationArn"]
+        video_responses.append(video_script_item)
+    
+    def is_all_completed(responses):
+        for resp in responses:
+            status = check_job_status(resp['invocation_arn'])
+            if status is None:
+                return False
+        return True
+
+    logging.info("Waiting for %d video parts to complete...", len(video_responses))
+    while not is_all_completed(video_responses):
+        logging.info("Not all parts are ready yet. Sleeping for 10 seconds...")
+        time.sleep(10)
+    logging.info("All video parts have completed processing.")
+    
+    # Update each video script entry with its final URI.
+    for item in video_responses:
+        item['uri'] = check_job_status(item['invocation_arn'])
+    
+    # Download each video part into its own subfolder inside parts_dir.
+    for item in video_responses:
+        index = item['part_index']
+        part_output_dir = os.path.join(parts_dir, f"video_{index:03d}")
+        os.makedirs(part_output_dir, exist_ok=True)
+        video_uri = item['uri'] + "/video.mp4"
+        logging.info("Downloading video part %d from %s to %s", index, video_uri, part_output_dir)
+        download_s3_prefix(video_uri, part_output_dir)
+    
+    # Move the downloaded parts from 'parts' into the output_dir so that they appear as video_000, video_001, etc.
+    for folder in os.listdir(parts_dir):
+        src = os.path.join(parts_dir, folder)
+        dst = os.path.join(output_dir, folder)
+        logging.info("Moving folder %s to %s", src, dst)
+        shutil.move(src, dst)
+    os.rmdir(parts_dir)
+
+    # Keep freshly generated clips for later jobs with the same scene prompt.
+    if clip_cache is not None:
+        for item in video_responses:
+            clip_path = os.path.join(output_dir, f"video_{item['part_index']:03d}", "output.mp4")
+            if os.path.exists(clip_path):
+                clip_cache.store(item['clip_key'], clip_path)
+    
+    # Render in a private scratch folder (tmpfs when it fits) unless the caller supplied one.
+    if work_dir is None:
+        with scratch_workspace(estimate_job_bytes(output_dir)) as scratch_dir:
+            render_video(video_script, output_dir, scratch_dir)
+    else:
+        render_video(video_script, output_dir, work_dir)
+
+
+def publish_file(src: str, dst: str):
+    """
+    Moves src to dst so dst only ever appears complete. The scratch folder is often
+    on tmpfs, where the move is a copy; it goes to a temporary name next to dst first.
+    """
+    partial = dst + ".part"
+    shutil.move(src, partial)
+    os.replace(partial, dst)
+
+
+def render_video(video_script, output_dir: str, work_dir: str):
+    """
+    Runs ultimate_pipeline in work_dir and moves the final video and preview into output_dir.
+    """
+    from process_subs import ultimate_pipeline
+
+    logging.info("Running ultimate_pipeline on video_script in folder: %s", output_dir)
+    ultimate_pipeline(video_script, output_dir, work_dir)
+    
+    # After processing, the finished video is created at "<work_dir>/videos/final_vid.mp4".
+    global_final = os.path.join(work_dir, "videos", "final_vid.mp4")
+    if not os.path.exists(global_final):
+        logging.error("Final video not found at %s", global_final)
+        return
+    
+    # The render step saves the first frame as a preview image next to the final video.
+    # It is published first: final_vid.mp4 marks the job as finished for listings and the stock index.
+    global_preview = os.path.join(work_dir, "videos", "preview.jpg")
+    if os.path.exists(global_preview):
+        preview_path = os.path.join(output_dir, "preview.jpg")
+        publish_file(global_preview, preview_path)
+        logging.info("Preview image saved to %s", preview_path)
+    else:
+        logging.error("No preview frame was produced by the render step.")
+    
+    final_video_path = os.path.join(output_dir, "final_vid.mp4")
+    publish_file(global_final, final_video_path)
+    logging.info("Moved final video from %s to %s", global_final, final_video_path)
+    
+    # Clean up temporary directories.
+    for temp_dir in [os.path.join(work_dir, "videos"), os.path.join(work_dir, "audio_files")]:
+        if os.path.exists(temp_dir):
+            shutil.rmtree(temp_dir)
+            logging.info("Deleted temporary folder '%s'", temp_dir)
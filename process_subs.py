@@ -1,99 +1,125 @@
 import os
-import json
 import subprocess
 import re
-import cv2
 from datetime import timedelta
 
-from elevenlabs.client import ElevenLabs
-from elevenlabs import save, Voice, VoiceSettings
-import boto3
-from pydub import AudioSegment
-from dotenv import load_dotenv
+from config import load_environment
+from media_info import get_media_info, get_video_duration
 
-load_dotenv()
+load_environment()
 
+# ElevenLabs raw PCM (16-bit little-endian mono) is streamed straight into ffmpeg,
+# so no per-sentence MP3s or combined audio file are written.
+TTS_OUTPUT_FORMAT = os.getenv("TTS_OUTPUT_FORMAT", "pcm_24000")
+PCM_SAMPLE_WIDTH = 2
+SUBTITLE_STYLE = "BackColour=&HFF000000,BorderStyle=3"
 
-APIKEY = os.getenv("APIKEY")
-ACCESSKEY = os.getenv("ACCESSKEY")
-ELEVENLABS_APIKEY = os.getenv("ELEVENLABS_APIKEY")
-os.environ['ELEVENLABS_APIKEY'] = ELEVENLABS_APIKEY
-os.environ['AWS_ACCESS_KEY_ID'] = ACCESSKEY
-os.environ['AWS_SECRET_ACCESS_KEY'] = APIKEY
-os.environ['AWS_DEFAULT_REGION'] = 'us-east-1'
-client = ElevenLabs(api_key=ELEVENLABS_APIKEY)
 
+_elevenlabs_client = None
 
-def ultimate_pipeline(json_data, videos_path):
+
+def get_elevenlabs_client():
+    """
+    Returns the shared ElevenLabs client, creating it on first use so that
+    importing this module does not pull in the SDK.
+    """
+    global _elevenlabs_client
+    if _elevenlabs_client is None:
+        from elevenlabs.client import ElevenLabs
+        _elevenlabs_client = ElevenLabs(api_key=os.getenv("ELEVENLABS_APIKEY"))
+    return _elevenlabs_client
+
+
+def _filter_quote(value):
+    """Quote a value for use inside an ffmpeg filtergraph option."""
+    return "'" + value.replace("'", "'\\''") + "'"
+
+
+def render_final_video(sections, srt_file_path, pcm_audio, sample_rate, finished_video, preview_path):
+    """
+    Renders the final video in a single ffmpeg run:
+      - each section clip is slowed down to its target duration (setpts),
+      - the clips are concatenated and the subtitles burned in,
+      - the narration is read as raw PCM from stdin and muxed as AAC,
+      - the first rendered frame is written to preview_path.
+    Nothing is written between stages; the only outputs are finished_video and preview_path.
+
+    Parameters:
+      - sections: list of (input_video_path, target_duration) in playback order.
+    """
+    first_info = get_media_info(sections[0][0])
+    fps = first_info.fps or 24
+    width, height = first_info.width, first_info.height
+
+    command = ["ffmpeg", "-y"]
+    filters = []
+    for i, (input_video_path, target_duration) in enumerate(sections):
+        original_duration = get_video_duration(input_video_path)
+        slowdown_factor = target_duration / original_duration
+        print(f"  Section clip {input_video_path}: {original_duration:.2f}s -> {target_duration:.2f}s "
+              f"(factor {slowdown_factor:.2f})")
+        command += ["-i", input_video_path]
+        filters.append(f"[{i}:v]setpts={slowdown_factor:.6f}*PTS,fps={fps:.3f},"
+                       f"scale={width}:{height},setsar=1[v{i}]")
+    audio_input = len(sections)
+    command += ["-f", "s16le", "-ar", str(sample_rate), "-ac", "1", "-i", "pipe:0"]
+    filters.append("".join(f"[v{i}]" for i in range(len(sections))) + f"concat=n={len(sections)}:v=1:a=0[cat]")
+    filters.append(f"[cat]subtitles={_filter_quote(srt_file_path)}:force_style={_filter_quote(SUBTITLE_STYLE)},"
+                   "split=2[vout][vprev]")
+    command += [
+        "-filter_complex", ";".join(filters),
+        "-map", "[vout]", "-map", f"{audio_input}:a",
+        "-c:v", "libx264", "-pix_fmt", "yuv420p", "-c:a", "aac",
+        "-movflags", "+faststart",
+        finished_video,
+        "-map", "[vprev]", "-frames:v", "1", "-update", "1", "-q:v", "2", preview_path,
+    ]
+    print("Running command:", " ".join(command))
+    subprocess.run(command, input=pcm_audio, check=True)
+
+
+def ultimate_pipeline(json_data, videos_path, work_dir="."):
     """
     Runs the entire processing pipeline:
       1. Parses the JSON input (which contains video script and prompts) and splits the video script into sentences.
-      2. For each sentence, generates speech audio using AWS Polly.
+      2. For each sentence, generates speech audio with ElevenLabs as raw PCM kept in memory.
       3. Measures each audio clip’s duration and writes an SRT subtitle file.
       4. Computes a target duration per “section” (JSON entry) that later is used to slow down video segments.
       5. For each section, looks in videos_path for subfolders (named video_000, video_001, …) that contain an 'output.mp4'.
-         It then slows down the video using ffmpeg so that its duration matches the target duration.
-      6. Concatenates all processed video pieces.
-      7. Combines all generated audio sentence files into one audio file.
-      8. Overlays the subtitles onto the concatenated video and merges the new video with the combined audio.
-      9. Returns the filename of the finished video.
+      6. Joins the sentence audio (with pauses) into one PCM track in memory.
+      7. Renders the final video in one ffmpeg run: slows down and concatenates the sections, burns in the
+         subtitles and muxes the PCM track piped through stdin (see render_final_video).
+      8. Returns the filename of the finished video; the first rendered frame is saved next to it as preview.jpg.
       
     Parameters:
       - json_data: a JSON string (or JSON structure dumped as a string) with the video prompt and video script.
       - videos_path: the path to the root folder where videos are stored.
                      It is expected that videos are in subfolders named video_000, video_001, etc.,
                      each containing an 'output.mp4' file.
+      - work_dir: scratch folder for the subtitles and the rendered output ('audio_files' and 'videos').
+                  Concurrent jobs must each use their own work_dir (see scratch.scratch_workspace).
     
     Returns:
-      - The filename of the final video (finished.mp4).
+      - The filename of the final video (final_vid.mp4).
     """
     
+    client = get_elevenlabs_client()
+    sample_rate = int(TTS_OUTPUT_FORMAT.split("_")[1])
+
     # Helper Functions
     
     def format_srt_time(seconds):
         """Convert seconds to SRT timestamp format: HH:MM:SS,mmm"""
         millisec = int((seconds - int(seconds)) * 1000)
         return f"{int(seconds // 3600):02}:{int((seconds % 3600) // 60):02}:{int(seconds % 60):02},{millisec:03}"
-    
-    def get_video_duration(file_path):
-        """
-        Uses ffprobe to get the duration of a video file.
-        """
-        command = [
-            "ffprobe",
-            "-v", "error",
-            "-select_streams", "v:0",
-            "-show_entries", "format=duration",
-            "-of", "json",
-            file_path
-        ]
-        result = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-        info = json.loads(result.stdout)
-        return float(info["format"]["duration"])
-    
-    def slow_down_video_ffmpeg(input_video_path, output_video_path, target_duration):
-        """
-        Slows down the video so that its new duration matches target_duration.
-        """
-        original_duration = get_video_duration(input_video_path)
-        slowdown_factor = target_duration / original_duration
-        print(f"\nSlowing down video:\n  Input: {input_video_path}\n  Original duration: {original_duration:.2f}s, "
-              f"Target: {target_duration:.2f}s, Factor: {slowdown_factor:.2f}")
-        command = [
-            "ffmpeg",
-            "-y",  # Force overwrite
-            "-i", input_video_path,
-            "-filter:v", f"setpts={slowdown_factor}*PTS",
-            output_video_path
-        ]
 
-        print("Running command:", " ".join(command))
-        subprocess.run(command, check=True)
+    def silence(seconds):
+        return b"\0" * (int(round(seconds * sample_rate)) * PCM_SAMPLE_WIDTH)
     
     # 1. Prepare Directories and Parse JSON
     
-    # Directory for audio files (and generated subtitles)
-    audio_dir = "audio_files"
+    # Directory for the generated subtitles
+    audio_dir = os.path.join(work_dir, "audio_files")
     os.makedirs(audio_dir, exist_ok=True)
     
     # Parse JSON data (expecting a JSON string)
@@ -115,8 +141,8 @@ def ultimate_pipeline(json_data, videos_path):
 
     # 2. Generate Audio (Speech) and Build SRT Entries
     
-    # Create AWS Polly client (use your own secure credentials management in production)     
     srt_entries = []
+    audio_chunks = []            # PCM chunks (sentences and the pauses between them), in playback order
     section_durations = {}       # Will store the (extended) target duration for each section
     cumulative_durations = {}    # Cumulative timestamp per sentence (for debugging/logging)
     current_time = 0.0           # Running timestamp (in seconds)
@@ -131,19 +157,15 @@ def ultimate_pipeline(json_data, videos_path):
     for section, sentences in script_sentences.items():
         total_duration = 0.0  # Total duration (in seconds) for the current section (without extra extension)
         for idx, sentence in enumerate(sentences):
-            # Generate speech audio using AWS Polly
+            # Generate speech audio as raw PCM and keep it in memory
             response = client.text_to_speech.convert(
                 text=sentence,
                 voice_id="7VqWGAWwo2HMrylfKrcm",
                 model_id="eleven_multilingual_v2",
-                output_format="mp3_44100_128",
+                output_format=TTS_OUTPUT_FORMAT,
             )
-            file_path = os.path.join(audio_dir, f"section_{section}_sentence_{idx}.mp3")
-            save(response, file_path)
-             
-            # Load the generated audio and get its duration in seconds
-            audio_clip = AudioSegment.from_mp3(file_path)
-            duration = len(audio_clip) / 1000.0  # milliseconds -> seconds
+            audio_clip = b"".join(response)
+            duration = len(audio_clip) / (PCM_SAMPLE_WIDTH * sample_rate)
             
             # Decide on silence duration: no silence before the very first sentence; otherwise:
             # 0.3 sec if in the same section; 1.3 sec if changing sections.
@@ -154,6 +176,8 @@ def ultimate_pipeline(json_data, videos_path):
             else:
                 silence_duration = 1.3
             current_time += silence_duration  # account for the silence before this sentence
+            audio_chunks.append(silence(silence_duration))
+            audio_chunks.append(audio_clip)
             
             total_duration += duration
             cumulative_durations[f"Sentence {idx+1} (Section {section})"] = current_time + duration
@@ -182,13 +206,9 @@ def ultimate_pipeline(json_data, videos_path):
         srt_file.writelines(srt_entries)
     print("SRT file created at:", srt_file_path)
     
-    # 3. Process Videos – Slow Down Each Section’s Video
-    
-    # The processed (slowed down) videos will be stored here.
-    new_videos_dir = os.path.join("videos", "new_videos")
-    os.makedirs(new_videos_dir, exist_ok=True)
+    # 3. Collect the Section Videos
     
-    print("\nProcessing videos for each section...")
+    sections = []
     for section, target_duration in section_durations.items():
         # Map section 1 -> folder video_000, section 2 -> video_001, etc.
         folder_name = f"video_{section - 1:03d}"
@@ -196,94 +216,24 @@ def ultimate_pipeline(json_data, videos_path):
         if not os.path.exists(input_video_path):
             print(f"Warning: Input video not found: {input_video_path}. Skipping section {section}.")
             continue
-        
-        output_filename = f"videos_{section:03d}.mp4"
-        output_video_path = os.path.join(new_videos_dir, output_filename)
-        slow_down_video_ffmpeg(input_video_path, output_video_path, target_duration)
-    
-    # 4. Concatenate the Processed Video Segments
-    
-    videos_combined_dir = os.path.join(new_videos_dir, "videos_combined")
-    os.makedirs(videos_combined_dir, exist_ok=True)
-    combined_video_path = os.path.join(videos_combined_dir, "video.mp4")
-    
-    # Find all processed video files matching the pattern (e.g., videos_001.mp4, videos_002.mp4, …)
-    video_files = sorted(
-        [f for f in os.listdir(new_videos_dir) if re.match(r'videos_\d+\.mp4$', f)],
-        key=lambda x: int(re.search(r'videos_(\d+)\.mp4$', x).group(1))
-    )
-    video_files = [os.path.join(new_videos_dir, f) for f in video_files]
-    if not video_files:
-        raise FileNotFoundError("No slowed-down video files found in the expected format.")
-    
-    # Open the first video to get video properties
-    cap = cv2.VideoCapture(video_files[0])
-    fps = cap.get(cv2.CAP_PROP_FPS)
-    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-    cap.release()
-    
-    fourcc = cv2.VideoWriter_fourcc(*'mp4v')
-    out = cv2.VideoWriter(combined_video_path, fourcc, fps, (width, height))
-    
-    print("\nConcatenating video segments...")
-    for video_file in video_files:
-        cap = cv2.VideoCapture(video_file)
-        frame_count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
-        print(f"  Processing {video_file} ({frame_count} frames)...")
-        while True:
-            ret, frame = cap.read()
-            if not ret:
-                break
-            out.write(frame)
-        cap.release()
-    out.release()
-    print("Combined video saved at:", combined_video_path)
-    
-    # 5. Combine the Audio Clips into a Single Audio Track
-    
-    # Look for the sentence audio files (they have 'sentence' in their filename)
-    audio_sentence_files = sorted(
-        [f for f in os.listdir(audio_dir) if f.endswith(".mp3") and "sentence" in f]
-    )
-    combined_audio = AudioSegment.silent(duration=0)
-    previous_section = None
-    for file in audio_sentence_files:
-        # File naming: section_{section}_sentence_{idx}.mp3
-        parts = file.split("_")
-        section_str = parts[1]  # This is the section number as a string
-        audio_clip = AudioSegment.from_mp3(os.path.join(audio_dir, file))
-        if previous_section is None:
-            silence_duration = 0
-        elif previous_section == section_str:
-            silence_duration = 300   # 0.3 seconds of silence (300 ms)
-        else:
-            silence_duration = 1300  # 1.3 seconds (1300 ms) between different sections
-        combined_audio += AudioSegment.silent(duration=silence_duration) + audio_clip
-        previous_section = section_str
+        sections.append((input_video_path, target_duration))
+    if not sections:
+        raise FileNotFoundError("No section videos found in the expected format.")
     
-    final_audio_path = os.path.join(audio_dir, "combined_audio.mp3")
-    combined_audio.export(final_audio_path, format="mp3")
-    print("Combined audio saved at:", final_audio_path)
+    # 4. Join the Audio Clips into a Single PCM Track (in memory)
     
-    # 6. Add Subtitles and Merge Audio with Video to Create the Final Output
+    pcm_audio = b"".join(audio_chunks)
+    print(f"Combined audio: {len(pcm_audio) / (PCM_SAMPLE_WIDTH * sample_rate):.2f} seconds of PCM")
     
-    subtitled_video = "videos/subtitled.mp4"
-    finished_video = "videos/final_vid.mp4"
+    # 5. Slow Down, Concatenate, Add Subtitles and Merge Audio in One Pass
     
-    # Use ffmpeg to burn in subtitles onto the combined video
-    cmd_subtitles = (
-        f'ffmpeg -y -i "{combined_video_path}" '
-        f'-vf "subtitles={srt_file_path}:force_style=\'BackColour=&HFF000000,BorderStyle=3\'" '
-        f'-c:a copy "{subtitled_video}"'
-    )    
-    print("\nAdding subtitles with command:\n", cmd_subtitles)
-    subprocess.run(cmd_subtitles, shell=True, check=True)
+    output_dir = os.path.join(work_dir, "videos")
+    os.makedirs(output_dir, exist_ok=True)
+    finished_video = os.path.join(output_dir, "final_vid.mp4")
+    preview_path = os.path.join(output_dir, "preview.jpg")
     
-    # Merge the subtitled video with the combined audio
-    cmd_merge = f'ffmpeg -y -i "{subtitled_video}" -i "{final_audio_path}" -c:v copy -c:a aac -strict experimental "{finished_video}"'
-    print("Merging audio and video with command:\n", cmd_merge)
-    subprocess.run(cmd_merge, shell=True, check=True)
+    print("\nRendering final video...")
+    render_final_video(sections, srt_file_path, pcm_audio, sample_rate, finished_video, preview_path)
     
     print("\nFinal video created:", finished_video)
     return finished_video
@@ -0,0 +1,176 @@
+"""
+Off-peak pre-generation of videos and quizzes for curriculum topics.
+
+Topics are ranked by how often they were requested recently (prompt log),
+topics that already have a finished video are skipped, and the rest are
+generated into saved_videos under a concurrency and spend budget, only
+while inside the off-peak window. /generate then serves them from stock.
+
+    python scheduler.py topics.txt --window 01:00-06:00 --max-jobs 2 --max-spend 60
+"""
+import argparse
+import logging
+import os
+import shutil
+import time
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime, timedelta
+
+from stock import normalize_prompt, read_prompt_log, StockIndex
+
+# Rough cost of one job in USD: ~12 Nova Reel clips of 6 s at $0.08/s plus LLM and TTS.
+DEFAULT_JOB_COST = 6.0
+
+
+def load_topics(path):
+    with open(path, "r", encoding="utf-8") as f:
+        return [line.strip() for line in f if line.strip() and not line.startswith("#")]
+
+
+def rank_topics(topics, lookback_days):
+    """
+    Orders topics by request count in the last `lookback_days` days, keeping
+    the file order for ties. A logged prompt counts for a topic if it equals
+    or contains the topic after normalization.
+    """
+    since = time.time() - lookback_days * 86400
+    counts = Counter(normalize_prompt(p) for p in read_prompt_log(since))
+    ranked = []
+    seen = set()
+    for order, topic in enumerate(topics):
+        key = normalize_prompt(topic)
+        if key in seen:
+            continue
+        seen.add(key)
+        frequency = sum(count for prompt, count in counts.items() if key in prompt)
+        ranked.append((-frequency, order, topic, frequency))
+    ranked.sort()
+    return [(topic, frequency) for _, _, topic, frequency in ranked]
+
+
+def parse_window(window):
+    start, end = window.split("-")
+    start = datetime.strptime(start, "%H:%M").time()
+    end = datetime.strptime(end, "%H:%M").time()
+    return start, end
+
+
+def in_window(window, now=None):
+    if window is None:
+        return True
+    start, end = window
+    current = (now or datetime.now()).time()
+    if start <= end:
+        return start <= current < end
+    # Window wraps midnight, e.g. 22:00-06:00.
+    return current >= start or current < end
+
+
+def seconds_until_window(window, now=None):
+    now = now or datetime.now()
+    if in_window(window, now):
+        return 0.0
+    start_at = datetime.combine(now.date(), window[0])
+    if start_at <= now:
+        start_at += timedelta(days=1)
+    return (start_at - now).total_seconds()
+
+
+def run_job(topic, saved_videos):
+    # Imported here so `--dry-run` and ranking do not load the pipeline.
+    from pipeline import generate_video
+
+    output_dir = os.path.join(saved_videos, uuid.uuid4().hex)
+    try:
+        logging.info("Pre-generating '%s' into %s", topic, output_dir)
+        # generate_video renders in its own scratch workspace, so concurrent jobs do not collide.
+        generate_video(topic, output_dir)
+        if not os.path.exists(os.path.join(output_dir, "final_vid.mp4")):
+            raise RuntimeError(f"No final video produced for '{topic}'")
+        return output_dir
+    except Exception:
+        # Do not leave half-finished jobs in the listing.
+        shutil.rmtree(output_dir, ignore_errors=True)
+        raise
+
+
+def run_schedule(topics, saved_videos, max_jobs, max_spend, job_cost, window, lookback_days, dry_run=False):
+    ranked = rank_topics(topics, lookback_days)
+    stock_index = StockIndex(saved_videos)
+    stock_index.refresh()
+    pending = []
+    for topic, frequency in ranked:
+        stocked_id = stock_index.lookup(topic)
+        if stocked_id is not None:
+            logging.info("Skipping '%s': already in stock as %s", topic, stocked_id)
+            continue
+        pending.append((topic, frequency))
+
+    if dry_run:
+        for topic, frequency in pending:
+            print(f"{frequency:5d}  {topic}")
+        return {"generated": 0, "failed": 0, "remaining": len(pending), "spent": 0.0}
+
+    delay = seconds_until_window(window)
+    if delay > 0:
+        logging.info("Waiting %.0f minutes for the off-peak window", delay / 60)
+        time.sleep(delay)
+
+    spent = 0.0
+    generated = failed = 0
+    running = {}
+    with ThreadPoolExecutor(max_workers=max_jobs) as pool:
+        while pending or running:
+            can_submit = (pending and len(running) < max_jobs
+                          and spent + job_cost <= max_spend and in_window(window))
+            if can_submit:
+                topic, frequency = pending.pop(0)
+                spent += job_cost  # Reserve the budget before the job starts spending it.
+                logging.info("Starting '%s' (requested %d times); estimated spend %.2f/%.2f USD",
+                             topic, frequency, spent, max_spend)
+                running[pool.submit(run_job, topic, saved_videos)] = topic
+                continue
+            if not running:
+                # Out of budget or outside the window, and nothing left to wait for.
+                break
+            done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for future in done:
+                topic = running.pop(future)
+                try:
+                    output_dir = future.result()
+                    generated += 1
+                    logging.info("Pre-generated '%s' at %s", topic, output_dir)
+                except Exception as e:
+                    failed += 1
+                    logging.error("Pre-generation failed for '%s': %s", topic, e)
+
+    summary = {"generated": generated, "failed": failed, "remaining": len(pending), "spent": spent}
+    logging.info("Pre-generation finished: %s", summary)
+    return summary
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s: %(message)s")
+    parser = argparse.ArgumentParser(description="Pre-generate videos for curriculum topics during off-peak hours.")
+    parser.add_argument("topics", help="Text file with one curriculum topic per line.")
+    parser.add_argument("--saved-videos", default="saved_videos")
+    parser.add_argument("--max-jobs", type=int, default=2, help="Concurrent generation jobs.")
+    parser.add_argument("--max-spend", type=float, default=60.0, help="API spend budget in USD for this run.")
+    parser.add_argument("--job-cost", type=float, default=DEFAULT_JOB_COST, help="Estimated USD per job.")
+    parser.add_argument("--window", default="01:00-06:00",
+                        help="Off-peak window HH:MM-HH:MM (local time); 'always' to ignore.")
+    parser.add_argument("--lookback-days", type=float, default=14.0,
+                        help="How far back the prompt log is counted when ranking topics.")
+    parser.add_argument("--dry-run", action="store_true", help="Only print the ranked topics that would be generated.")
+    args = parser.parse_args()
+
+    window = None if args.window == "always" else parse_window(args.window)
+    os.makedirs(args.saved_videos, exist_ok=True)
+    run_schedule(load_topics(args.topics), args.saved_videos, args.max_jobs, args.max_spend,
+                 args.job_cost, window, args.lookback_days, dry_run=args.dry_run)
+
+
+if __name__ == "__main__":
+    main()
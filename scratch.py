@@ -0,0 +1,70 @@
+"""
+Per-job scratch workspaces for the render pipeline.
+
+Intermediates go to tmpfs (/dev/shm) when it has room for the job, so they
+never hit the shared disks; otherwise they fall back to a disk temp folder.
+"""
+import logging
+import os
+import shutil
+import tempfile
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# "auto": tmpfs if it fits, else disk; "tmpfs": same but logged as a warning on fallback; "disk": never tmpfs.
+SCRATCH_MODE = os.getenv("SCRATCH_MODE", "auto")
+SCRATCH_TMPFS_DIR = os.getenv("SCRATCH_TMPFS_DIR", "/dev/shm")
+SCRATCH_DISK_DIR = os.getenv("SCRATCH_DISK_DIR", tempfile.gettempdir())
+# tmpfs space that must stay free for other processes after reserving a job.
+SCRATCH_TMPFS_RESERVE_BYTES = int(os.getenv("SCRATCH_TMPFS_RESERVE_BYTES", str(512 * 1024 ** 2)))
+# Largest workspace a single job may put on tmpfs.
+SCRATCH_TMPFS_MAX_JOB_BYTES = int(os.getenv("SCRATCH_TMPFS_MAX_JOB_BYTES", str(2 * 1024 ** 3)))
+
+
+def _free_bytes(path):
+    st = os.statvfs(path)
+    return st.f_bavail * st.f_frsize
+
+
+def choose_scratch_root(expected_bytes):
+    """
+    Returns the folder a workspace of about expected_bytes should be created in.
+    """
+    if SCRATCH_MODE != "disk" and os.path.isdir(SCRATCH_TMPFS_DIR):
+        try:
+            free = _free_bytes(SCRATCH_TMPFS_DIR)
+        except OSError:
+            free = 0
+        if expected_bytes <= SCRATCH_TMPFS_MAX_JOB_BYTES and free - expected_bytes >= SCRATCH_TMPFS_RESERVE_BYTES:
+            return SCRATCH_TMPFS_DIR
+        log = logger.warning if SCRATCH_MODE == "tmpfs" else logger.info
+        log("tmpfs has %d bytes free, job needs ~%d; using disk scratch", free, expected_bytes)
+    return SCRATCH_DISK_DIR
+
+
+def estimate_job_bytes(videos_path):
+    """
+    Rough scratch size for rendering the parts under videos_path: the final
+    video is at most about twice the source clips, plus room for subtitles and headroom.
+    """
+    total = 0
+    for root, _, files in os.walk(videos_path):
+        for name in files:
+            if name == "output.mp4":
+                total += os.path.getsize(os.path.join(root, name))
+    return total * 2 + 64 * 1024 ** 2
+
+
+@contextmanager
+def scratch_workspace(expected_bytes, prefix="ragengers_"):
+    """
+    Yields a fresh scratch folder sized for expected_bytes and deletes it afterwards.
+    """
+    root = choose_scratch_root(expected_bytes)
+    work_dir = tempfile.mkdtemp(prefix=prefix, dir=root)
+    logger.info("Using scratch workspace %s", work_dir)
+    try:
+        yield work_dir
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
@@ -0,0 +1,128 @@
+import json
+import os
+import re
+import threading
+import time
+
+# Every /generate request is appended here; the pre-generation scheduler ranks topics by it.
+PROMPT_LOG = os.getenv("PROMPT_LOG", "prompt_log.jsonl")
+
+# How often StockIndex.lookup picks up videos finished by other processes.
+STOCK_REFRESH_SECONDS = float(os.getenv("STOCK_REFRESH_SECONDS", "30"))
+
+_log_lock = threading.Lock()
+
+
+def normalize_prompt(prompt):
+    """
+    Case- and whitespace-insensitive form of a prompt, used to match requests to stocked videos.
+    """
+    return re.sub(r"\s+", " ", prompt).strip().casefold()
+
+
+def log_prompt(prompt, source="web", path=PROMPT_LOG):
+    record = {"ts": time.time(), "prompt": prompt, "source": source}
+    with _log_lock:
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+def read_prompt_log(since=None, path=PROMPT_LOG):
+    """
+    Yields logged prompts (newest entries last), optionally only those after `since` (epoch seconds).
+    """
+    if not os.path.exists(path):
+        return
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if since is not None and record.get("ts", 0) < since:
+                continue
+            yield record["prompt"]
+
+
+class StockIndex:
+    """
+    In-memory map from normalized prompt to the id of a finished video in saved_videos.
+
+    refresh() only reads prompt.txt of folders it has not indexed yet, and
+    re-checks folders whose job was still running; lookup() refreshes at most
+    every `refresh_interval` seconds, so videos finished by another process
+    (the scheduler) are picked up without a full scan per request.
+    """
+
+    def __init__(self, saved_videos, refresh_interval=STOCK_REFRESH_SECONDS):
+        self.saved_videos = saved_videos
+        self.refresh_interval = refresh_interval
+        self._by_prompt = {}
+        self._prompt_by_id = {}
+        self._last_refresh = None
+        self._lock = threading.Lock()
+
+    def _read_prompt(self, video_id):
+        try:
+            with open(os.path.join(self.saved_videos, video_id, "prompt.txt"), "r", encoding="utf-8") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def refresh(self):
+        if not os.path.isdir(self.saved_videos):
+            return
+        with self._lock:
+            present = set()
+            for entry in os.scandir(self.saved_videos):
+                if not entry.is_dir():
+                    continue
+                present.add(entry.name)
+                if entry.name in self._prompt_by_id:
+                    continue
+                if not os.path.exists(os.path.join(entry.path, "final_vid.mp4")):
+                    continue
+                prompt = self._read_prompt(entry.name)
+                if prompt is not None:
+                    self._add(entry.name, prompt)
+            for video_id in set(self._prompt_by_id) - present:
+                self._remove(video_id)
+            self._last_refresh = time.monotonic()
+
+    def _add(self, video_id, prompt):
+        key = normalize_prompt(prompt)
+        self._prompt_by_id[video_id] = key
+        self._by_prompt.setdefault(key, video_id)
+
+    def _remove(self, video_id):
+        key = self._prompt_by_id.pop(video_id, None)
+        if self._by_prompt.get(key) == video_id:
+            del self._by_prompt[key]
+            # Another finished video may have the same prompt.
+            for other_id, other_key in self._prompt_by_id.items():
+                if other_key == key:
+                    self._by_prompt[key] = other_id
+                    break
+
+    def add(self, video_id, prompt):
+        """
+        Registers a video that just finished in this process.
+        """
+        with self._lock:
+            self._add(video_id, prompt)
+
+    def lookup(self, prompt):
+        """
+        Returns the id of a finished video whose prompt matches `prompt` after normalization, or None.
+        """
+        if self._last_refresh is None or time.monotonic() - self._last_refresh >= self.refresh_interval:
+            self.refresh()
+        key = normalize_prompt(prompt)
+        with self._lock:
+            while key in self._by_prompt:
+                video_id = self._by_prompt[key]
+                if os.path.exists(os.path.join(self.saved_videos, video_id, "final_vid.mp4")):
+                    return video_id
+                # Evicted by the storage sweeper since the last refresh.
+                self._remove(video_id)
+        return None
@@ -0,0 +1,287 @@
+"""
+Lifecycle management for saved_videos.
+
+A sweep does three things:
+  1. compacts finished jobs (final_vid.mp4 present) by dropping the raw
+     video_NNN/output.mp4 parts, or hard-linking identical parts together
+     and with the clip cache when STORAGE_COMPACT_MODE=link;
+  2. deletes abandoned jobs that never produced a final video;
+  3. evicts finished jobs not viewed within the retention period, then the
+     least recently viewed ones until the folder is under quota.
+
+Views are recorded by touching <job>/.last_view (see main.video_detail).
+Finished jobs without a .last_view get one on the sweep that first sees
+them, so retention counts from then rather than from when the job was
+created (videos made before the sweeper existed are not deleted at once).
+
+    python storage.py --once
+"""
+import argparse
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+
+# Same hash as the clip cache's blob names, so parts can be linked to cached clips.
+from clip_cache import CLIP_CACHE_DIR, _file_sha256
+
+logger = logging.getLogger(__name__)
+
+STORAGE_QUOTA_BYTES = int(os.getenv("STORAGE_QUOTA_BYTES", str(20 * 1024 ** 3)))
+RETENTION_DAYS = float(os.getenv("STORAGE_RETENTION_DAYS", "30"))
+# "drop" deletes intermediate parts of finished jobs, "link" keeps them but deduplicates via hard links.
+COMPACT_MODE = os.getenv("STORAGE_COMPACT_MODE", "drop")
+# Jobs without a final video and untouched for this long are treated as failed.
+STALE_JOB_HOURS = float(os.getenv("STORAGE_STALE_JOB_HOURS", "24"))
+SWEEP_INTERVAL_SECONDS = float(os.getenv("STORAGE_SWEEP_INTERVAL", "600"))
+
+LAST_VIEW_FILE = ".last_view"
+PART_DIR_PATTERN = re.compile(r"video_\d{3}$")
+
+
+def record_view(job_dir):
+    """
+    Marks a job as just viewed; used as the LRU key for eviction.
+    """
+    marker = os.path.join(job_dir, LAST_VIEW_FILE)
+    try:
+        os.utime(marker)
+    except FileNotFoundError:
+        if os.path.isdir(job_dir):
+            open(marker, "a").close()
+
+
+def _last_view(job_dir):
+    for name in (LAST_VIEW_FILE, "final_vid.mp4"):
+        try:
+            return os.stat(os.path.join(job_dir, name)).st_mtime
+        except FileNotFoundError:
+            continue
+    return os.stat(job_dir).st_mtime
+
+
+def _latest_mtime(path):
+    latest = os.stat(path).st_mtime
+    for root, dirs, files in os.walk(path):
+        for name in dirs + files:
+            try:
+                latest = max(latest, os.stat(os.path.join(root, name)).st_mtime)
+            except FileNotFoundError:
+                continue
+    return latest
+
+
+def _inode_usage(job_dirs):
+    """
+    Returns ({(dev, inode): [size, set of jobs linking it]}, {job: set of (dev, inode)})
+    for the files under job_dirs, so hard-linked files are counted once.
+    """
+    usage = {}
+    job_files = {}
+    for job_dir in job_dirs:
+        keys = job_files[job_dir] = set()
+        for root, _, files in os.walk(job_dir):
+            for name in files:
+                try:
+                    st = os.stat(os.path.join(root, name))
+                except FileNotFoundError:
+                    continue
+                key = (st.st_dev, st.st_ino)
+                keys.add(key)
+                usage.setdefault(key, [st.st_size, set()])[1].add(job_dir)
+    return usage, job_files
+
+
+def _freeable_size(path):
+    """
+    Bytes that deleting path would actually free: hard-linked files only
+    count if every link to them lives under path.
+    """
+    inodes = {}
+    for root, _, files in os.walk(path):
+        for name in files:
+            try:
+                st = os.stat(os.path.join(root, name))
+            except FileNotFoundError:
+                continue
+            key = (st.st_dev, st.st_ino)
+            size, nlink, count = inodes.get(key, (st.st_size, st.st_nlink, 0))
+            inodes[key] = (size, nlink, count + 1)
+    return sum(size for size, nlink, count in inodes.values() if count >= nlink)
+
+
+class StorageManager:
+    def __init__(self, saved_videos="saved_videos", quota_bytes=STORAGE_QUOTA_BYTES,
+                 retention_days=RETENTION_DAYS, compact_mode=COMPACT_MODE,
+                 stale_job_hours=STALE_JOB_HOURS, clip_cache_dir=CLIP_CACHE_DIR):
+        self.saved_videos = saved_videos
+        self.quota_bytes = quota_bytes
+        self.retention_days = retention_days
+        self.compact_mode = compact_mode
+        self.stale_job_hours = stale_job_hours
+        self.clip_blobs_dir = os.path.join(clip_cache_dir, "blobs")
+        self.last_report = None
+        # (dev, inode, size, mtime) -> sha256, so link-mode sweeps only hash new parts.
+        self._hash_cache = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _jobs(self):
+        if not os.path.isdir(self.saved_videos):
+            return []
+        return [entry.path for entry in os.scandir(self.saved_videos) if entry.is_dir()]
+
+    def _remove_job(self, job_dir, reason):
+        freed = _freeable_size(job_dir)
+        shutil.rmtree(job_dir, ignore_errors=True)
+        logger.info("Removed %s (%s), %d bytes", job_dir, reason, freed)
+        return freed
+
+    def _compact_job(self, job_dir, known_parts):
+        freed = 0
+        leftover = os.path.join(job_dir, "parts")
+        if os.path.isdir(leftover):
+            freed += self._remove_job(leftover, "leftover download folder")
+        for entry in os.scandir(job_dir):
+            if not entry.is_dir() or not PART_DIR_PATTERN.match(entry.name):
+                continue
+            if self.compact_mode == "drop":
+                freed += self._remove_job(entry.path, "intermediate part")
+                continue
+            part = os.path.join(entry.path, "output.mp4")
+            if not os.path.isfile(part):
+                continue
+            st = os.stat(part)
+            hash_key = (st.st_dev, st.st_ino, st.st_size, st.st_mtime)
+            content_hash = self._hash_cache.get(hash_key)
+            if content_hash is None:
+                content_hash = self._hash_cache[hash_key] = _file_sha256(part)
+            canonical = known_parts.get(content_hash)
+            if canonical is None:
+                known_parts[content_hash] = part
+                continue
+            canonical_st = os.stat(canonical)
+            if (canonical_st.st_dev, canonical_st.st_ino) == (st.st_dev, st.st_ino):
+                continue
+            tmp_path = part + ".link"
+            try:
+                os.link(canonical, tmp_path)
+            except OSError:
+                # Different filesystem; nothing to share.
+                continue
+            os.replace(tmp_path, part)
+            if st.st_nlink == 1:
+                freed += st.st_size
+        return freed
+
+    def _known_parts(self):
+        """
+        Content hash -> path for clips already in the clip cache, so job parts can link to them.
+        """
+        known = {}
+        if os.path.isdir(self.clip_blobs_dir):
+            for name in os.listdir(self.clip_blobs_dir):
+                if name.endswith(".mp4"):
+                    known[name[:-4]] = os.path.join(self.clip_blobs_dir, name)
+        return known
+
+    def sweep(self):
+        """
+        Runs one compaction/retention/quota pass and returns a report dict.
+        """
+        with self._lock:
+            started = time.time()
+            now = time.time()
+            report = {"compacted_bytes": 0, "abandoned_bytes": 0, "expired_bytes": 0,
+                      "quota_evicted_bytes": 0, "jobs_removed": 0}
+            known_parts = self._known_parts() if self.compact_mode == "link" else {}
+            finished = []
+            for job_dir in self._jobs():
+                if os.path.exists(os.path.join(job_dir, "final_vid.mp4")):
+                    if not os.path.exists(os.path.join(job_dir, LAST_VIEW_FILE)):
+                        record_view(job_dir)
+                    report["compacted_bytes"] += self._compact_job(job_dir, known_parts)
+                    finished.append(job_dir)
+                elif now - _latest_mtime(job_dir) > self.stale_job_hours * 3600:
+                    report["abandoned_bytes"] += self._remove_job(job_dir, "abandoned")
+                    report["jobs_removed"] += 1
+
+            by_last_view = sorted((_last_view(job_dir), job_dir) for job_dir in finished)
+            kept = []
+            for viewed_at, job_dir in by_last_view:
+                if self.retention_days and now - viewed_at > self.retention_days * 86400:
+                    report["expired_bytes"] += self._remove_job(job_dir, "retention")
+                    report["jobs_removed"] += 1
+                else:
+                    kept.append(job_dir)
+
+            usage, job_files = _inode_usage(self._jobs())
+            total = sum(size for size, _ in usage.values())
+            # kept is ordered least recently viewed first.
+            for job_dir in kept:
+                if total <= self.quota_bytes:
+                    break
+                report["quota_evicted_bytes"] += self._remove_job(job_dir, "quota")
+                report["jobs_removed"] += 1
+                # Files shared with other jobs stay counted until their last job goes; files
+                # also linked from the clip cache leave saved_videos even though no disk is freed.
+                for key in job_files.get(job_dir, ()):
+                    size, holders = usage[key]
+                    holders.discard(job_dir)
+                    if not holders:
+                        total -= size
+
+            report["reclaimed_bytes"] = (report["compacted_bytes"] + report["abandoned_bytes"]
+                                         + report["expired_bytes"] + report["quota_evicted_bytes"])
+            report["used_bytes"] = total
+            report["duration_seconds"] = time.time() - started
+            self.last_report = report
+            logger.info("Storage sweep reclaimed %d bytes; %d bytes in use (quota %d)",
+                        report["reclaimed_bytes"], total, self.quota_bytes)
+            return report
+
+    def _run(self, interval):
+        while not self._stop.wait(interval):
+            try:
+                self.sweep()
+            except Exception as e:
+                logger.error("Storage sweep failed: %s", e)
+
+    def start(self, interval=SWEEP_INTERVAL_SECONDS):
+        """
+        Starts the background sweeper thread (one sweep every `interval` seconds).
+        """
+        if self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._run, args=(interval,), name="storage-sweeper", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s: %(message)s")
+    parser = argparse.ArgumentParser(description="Compact and evict saved videos.")
+    parser.add_argument("--saved-videos", default="saved_videos")
+    parser.add_argument("--quota-gb", type=float, default=STORAGE_QUOTA_BYTES / 1024 ** 3)
+    parser.add_argument("--retention-days", type=float, default=RETENTION_DAYS)
+    parser.add_argument("--compact-mode", choices=["drop", "link"], default=COMPACT_MODE)
+    parser.add_argument("--once", action="store_true", help="Run a single sweep and exit.")
+    parser.add_argument("--interval", type=float, default=SWEEP_INTERVAL_SECONDS)
+    args = parser.parse_args()
+
+    manager = StorageManager(args.saved_videos, int(args.quota_gb * 1024 ** 3),
+                             args.retention_days, args.compact_mode)
+    if args.once:
+        print(manager.sweep())
+    else:
+        while True:
+            print(manager.sweep())
+            time.sleep(args.interval)
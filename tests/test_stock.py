@@ -0,0 +1,42 @@
+import os
+
+from stock import StockIndex
+
+
+def make_job(saved_videos, video_id, prompt, finished=True):
+    job = saved_videos / video_id
+    job.mkdir(parents=True)
+    (job / "prompt.txt").write_text(prompt, encoding="utf-8")
+    if finished:
+        (job / "final_vid.mp4").write_bytes(b"")
+    return job
+
+
+def test_lookup_matches_normalized_prompt_of_finished_videos(tmp_path):
+    make_job(tmp_path, "done", "Hücre  Bölünmesi ")
+    make_job(tmp_path, "running", "Fotosentez", finished=False)
+    index = StockIndex(str(tmp_path))
+
+    assert index.lookup("hücre bölünmesi") == "done"
+    assert index.lookup("Fotosentez") is None
+
+
+def test_refresh_picks_up_videos_finished_elsewhere(tmp_path):
+    job = make_job(tmp_path, "running", "Fotosentez", finished=False)
+    index = StockIndex(str(tmp_path), refresh_interval=0)
+    assert index.lookup("Fotosentez") is None
+
+    (job / "final_vid.mp4").write_bytes(b"")
+
+    assert index.lookup("fotosentez") == "running"
+
+
+def test_evicted_video_falls_back_to_another_match(tmp_path):
+    make_job(tmp_path, "first", "Fotosentez")
+    make_job(tmp_path, "second", "fotosentez")
+    index = StockIndex(str(tmp_path), refresh_interval=3600)
+    served = index.lookup("Fotosentez")
+
+    os.remove(os.path.join(tmp_path, served, "final_vid.mp4"))
+
+    assert index.lookup("Fotosentez") == ({"first", "second"} - {served}).pop()
@@ -0,0 +1,127 @@
+import os
+import time
+
+from storage import LAST_VIEW_FILE, StorageManager
+
+DAY = 86400
+
+
+def make_job(saved_videos, name, final_bytes=1000, part_bytes=1000, age_days=0, part_data=None):
+    job = saved_videos / name
+    (job / "video_000").mkdir(parents=True)
+    (job / "final_vid.mp4").write_bytes(b"f" * final_bytes)
+    (job / "video_000" / "output.mp4").write_bytes(part_data or os.urandom(part_bytes))
+    set_age(job / "final_vid.mp4", age_days)
+    return job
+
+
+def set_age(path, age_days):
+    stamp = time.time() - age_days * DAY
+    os.utime(path, (stamp, stamp))
+
+
+def manager(tmp_path, **kwargs):
+    kwargs.setdefault("quota_bytes", 10 ** 9)
+    kwargs.setdefault("retention_days", 30)
+    kwargs.setdefault("compact_mode", "drop")
+    return StorageManager(str(tmp_path / "saved_videos"), clip_cache_dir=str(tmp_path / "clip_cache"), **kwargs)
+
+
+def test_first_sweep_keeps_old_jobs_without_view_marker(tmp_path):
+    job = make_job(tmp_path / "saved_videos", "old", age_days=40)
+
+    report = manager(tmp_path).sweep()
+
+    assert job.exists()
+    assert (job / LAST_VIEW_FILE).exists()
+    assert report["jobs_removed"] == 0
+
+
+def test_retention_removes_jobs_not_viewed_recently(tmp_path):
+    saved = tmp_path / "saved_videos"
+    stale = make_job(saved, "stale")
+    (stale / LAST_VIEW_FILE).touch()
+    set_age(stale / LAST_VIEW_FILE, 40)
+    fresh = make_job(saved, "fresh", age_days=40)
+    (fresh / LAST_VIEW_FILE).touch()
+
+    report = manager(tmp_path).sweep()
+
+    assert not stale.exists()
+    assert fresh.exists()
+    assert report["jobs_removed"] == 1
+    assert report["expired_bytes"] == 1000
+
+
+def test_abandoned_jobs_are_removed(tmp_path):
+    job = tmp_path / "saved_videos" / "failed"
+    job.mkdir(parents=True)
+    (job / "prompt.txt").write_text("x")
+    set_age(job / "prompt.txt", 2)
+    set_age(job, 2)
+
+    report = manager(tmp_path).sweep()
+
+    assert not job.exists()
+    assert report["abandoned_bytes"] == 1
+
+
+def test_drop_mode_removes_parts_of_finished_jobs(tmp_path):
+    job = make_job(tmp_path / "saved_videos", "done")
+
+    report = manager(tmp_path).sweep()
+
+    assert not (job / "video_000").exists()
+    assert report["compacted_bytes"] == 1000
+
+
+def test_quota_evicts_least_recently_viewed_first(tmp_path):
+    saved = tmp_path / "saved_videos"
+    jobs = [make_job(saved, f"job{i}", part_bytes=0) for i in range(3)]
+    for age, job in zip((3, 1, 2), jobs):
+        (job / LAST_VIEW_FILE).touch()
+        set_age(job / LAST_VIEW_FILE, age)
+
+    report = manager(tmp_path, quota_bytes=2500).sweep()
+
+    assert [job.exists() for job in jobs] == [False, True, True]
+    assert report["used_bytes"] == 2000
+
+
+def test_link_mode_deduplicates_parts(tmp_path):
+    saved = tmp_path / "saved_videos"
+    data = os.urandom(1000)
+    first = make_job(saved, "a", part_data=data)
+    second = make_job(saved, "b", part_data=data)
+
+    report = manager(tmp_path, compact_mode="link").sweep()
+
+    first_part = os.stat(first / "video_000" / "output.mp4")
+    second_part = os.stat(second / "video_000" / "output.mp4")
+    assert first_part.st_ino == second_part.st_ino
+    assert report["compacted_bytes"] == 1000
+    assert report["used_bytes"] == 3000
+
+
+def test_link_mode_quota_counts_parts_shared_with_clip_cache(tmp_path):
+    import hashlib
+
+    saved = tmp_path / "saved_videos"
+    blobs = tmp_path / "clip_cache" / "blobs"
+    blobs.mkdir(parents=True)
+    jobs = []
+    for i in range(3):
+        data = os.urandom(1000)
+        (blobs / (hashlib.sha256(data).hexdigest() + ".mp4")).write_bytes(data)
+        job = make_job(saved, f"job{i}", part_data=data)
+        (job / LAST_VIEW_FILE).touch()
+        set_age(job / LAST_VIEW_FILE, 3 - i)
+        jobs.append(job)
+
+    # 6000 bytes in saved_videos; dropping the oldest job is enough, although only
+    # its final video is freed on disk (the part stays in the clip cache).
+    report = manager(tmp_path, compact_mode="link", quota_bytes=4000).sweep()
+
+    assert [job.exists() for job in jobs] == [False, True, True]
+    assert report["used_bytes"] == 4000
+    assert report["quota_evicted_bytes"] == 1000
@@ -1,24 +1,39 @@
+import hashlib
 import random
-import boto3
 import os
 
+from config import load_environment
+from aws_clients import get_client
+
 SERVICE_NAME = 'bedrock-runtime'
 REGION_NAME = 'us-east-1'
-from dotenv import load_dotenv
 
-load_dotenv()
+load_environment()
+
+# Nova Reel generation config used for every clip.
+VIDEO_FPS = 24
+VIDEO_DURATION = 6
+VIDEO_DIMENSION = "1280x720"
+
+# When enabled, the seed is derived from the prompt and config, so identical
+# prompts reproduce the same clip and can be served from the clip cache.
+DETERMINISTIC_SEED = os.getenv("NOVA_REEL_DETERMINISTIC_SEED", "0") == "1"
+
 
+def get_video_seed(video_prompt, fps=VIDEO_FPS, duration=VIDEO_DURATION, dimension=VIDEO_DIMENSION):
+    """
+    Returns the seed for a clip: a stable hash of its inputs in deterministic
+    mode, otherwise a random one.
+    """
+    if not DETERMINISTIC_SEED:
+        return random.randint(0, 1000000)
+    payload = f"{video_prompt}|{duration}|{fps}|{dimension}".encode("utf-8")
+    return int(hashlib.sha256(payload).hexdigest()[:8], 16) % 1000001
 
-APIKEY = os.getenv("APIKEY")
-ACCESSKEY = os.getenv("ACCESSKEY")
-ELEVENLABS_APIKEY = os.getenv("ELEVENLABS_APIKEY")
-os.environ['ELEVENLABS_APIKEY'] = ELEVENLABS_APIKEY
-os.environ['AWS_ACCESS_KEY_ID'] = ACCESSKEY
-os.environ['AWS_SECRET_ACCESS_KEY'] = APIKEY
-os.environ['AWS_DEFAULT_REGION'] = 'us-east-1'
 
-bedrock_runtime = boto3.client(service_name=SERVICE_NAME, region_name=REGION_NAME)
-def get_video_model_input(video_prompt, fps = 24, duration = 6, dimension = "1280x720"):
+def get_video_model_input(video_prompt, fps=VIDEO_FPS, duration=VIDEO_DURATION, dimension=VIDEO_DIMENSION, seed=None):
+    if seed is None:
+        seed = get_video_seed(video_prompt, fps, duration, dimension)
     model_input = {
         "taskType": "TEXT_VIDEO",
         "textToVideoParams": {
@@ -28,13 +43,13 @@ def get_video_model_input(video_prompt, fps = 24, duration = 6, dimension = "128
             "durationSeconds": duration,
             "fps": fps,
             "dimension": dimension,
-            "seed": random.randint(0, 1000000)
+            "seed": seed
         }
     }
     return model_input
 
 def check_job_status(invocation_arn):
-    response = bedrock_runtime.get_async_invoke(invocationArn=invocation_arn)
+    response = get_client(SERVICE_NAME, REGION_NAME).get_async_invoke(invocationArn=invocation_arn)
     status = response["status"]
     # print(f"Current Status: {status}")
 
@@ -53,7 +68,7 @@ def download_s3_prefix(s3_name, local_dir):
     bucket_name = s3_name.replace("s3://", "").split("/")[0]
     prefix = "/".join(s3_name.replace("s3://", "").split("/")[1:]).split("/")[0]
     print(bucket_name, prefix)
-    s3 = boto3.client('s3')
+    s3 = get_client('s3')
     paginator = s3.get_paginator('list_objects_v2')
     for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix):
         # Check if any objects are returned
@@ -1,42 +1,53 @@
-import boto3
 import json
 import logging
 from botocore.exceptions import ClientError
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
-from dotenv import load_dotenv
+from config import load_environment
+from aws_clients import get_client
 
-load_dotenv()
-
-
-APIKEY = os.getenv("APIKEY")
-ACCESSKEY = os.getenv("ACCESSKEY")
-ELEVENLABS_APIKEY = os.getenv("ELEVENLABS_APIKEY")
-os.environ['ELEVENLABS_APIKEY'] = ELEVENLABS_APIKEY
-os.environ['AWS_ACCESS_KEY_ID'] = ACCESSKEY
-os.environ['AWS_SECRET_ACCESS_KEY'] = APIKEY
-os.environ['AWS_DEFAULT_REGION'] = 'us-east-1'
+load_environment()
 
 SERVICE_NAME = 'bedrock-runtime'
 REGION_NAME = 'us-east-1'
 ANTHROPIC_VERSION = 'bedrock-2023-05-31'
 TEMPERATURE = 0.5
 MAX_TOKENS = 3000
+# Script ve quiz tek yanıta sığmalı; Claude 3.5 Haiku’nun çıktı üst sınırı.
+STRUCTURED_MAX_TOKENS = 8192
+KNOWLEDGE_BASE_ID = 'QALSFMRFUA'  # Gerçek KB ID’nizi girin
+RETRIEVAL_TOP_K = 10
+
+# Yerel vektör indeksi (local_retrieval.py): KB’den önce sorulur, düşük güvende KB’ye düşülür.
+LOCAL_RETRIEVAL = os.getenv("LOCAL_RETRIEVAL", "1") == "1"
+LOCAL_RETRIEVAL_MIN_SCORE = float(os.getenv("LOCAL_RETRIEVAL_MIN_SCORE", "0.55"))
+
+_indexing_executor = None
+_indexing_lock = threading.Lock()
+
+# "single": script ve quiz tek bir tool-use çağrısıyla üretilir; "multi": eski dört adımlı akış.
+SCRIPT_GENERATION_MODE = os.getenv("SCRIPT_GENERATION_MODE", "single")
+# Şemaya uymayan yanıt için modelden en fazla kaç kez düzeltme istenir.
+MAX_REPAIR_ATTEMPTS = int(os.getenv("SCRIPT_MAX_REPAIR_ATTEMPTS", "1"))
+# Nova Reel metin prompt’u için üst sınır.
+VIDEO_PROMPT_MAX_LENGTH = 512
 
 def retrieve_chunks_from_kb(query, knowledge_base_id):
     """
     İlgili sorguya göre knowledge base’den parçaları getirir.
     """
     try:
-        bedrock_agent_runtime = boto3.client('bedrock-agent-runtime', region_name=REGION_NAME)
+        bedrock_agent_runtime = get_client('bedrock-agent-runtime', REGION_NAME)
         retrieval_request = {
             'knowledgeBaseId': knowledge_base_id,
             'retrievalQuery': {'text': query},
             'retrievalConfiguration': {
-                'vectorSearchConfiguration': {'numberOfResults': 10}
+                'vectorSearchConfiguration': {'numberOfResults': RETRIEVAL_TOP_K}
             }
         }
         response = bedrock_agent_runtime.retrieve(**retrieval_request)
@@ -54,7 +65,7 @@ def generate_response_with_llm(prompt, model_id='us.anthropic.claude-3-5-haiku-2
     Verilen prompt’u belirtilen LLM modeline gönderip yanıtı döner.
     """
     try:
-        bedrock_runtime = boto3.client(service_name=SERVICE_NAME, region_name=REGION_NAME)
+        bedrock_runtime = get_client(SERVICE_NAME, REGION_NAME)
         body = json.dumps({
             'anthropic_version': ANTHROPIC_VERSION,
             'messages': [{'role': 'user', 'content': prompt}],
@@ -69,15 +80,58 @@ def generate_response_with_llm(prompt, model_id='us.anthropic.claude-3-5-haiku-2
         logger.error(f"Model çağrısı sırasında client hatası oluştu: {error_message}")
         return "An error occurred while generating the response."
 
-def get_video_script_and_quiz(user_query):
+def retrieve_from_local_index(user_query):
     """
-    Kullanıcının sorusuna göre:
-    1. Knowledge base’den ilgili belgeleri getirir,
-    2. Konu özetini oluşturup 180 saniyelik video segmentleri üretir (video script JSON olarak),
-    3. Oluşan video scripti kullanarak; segmentleri 1–3, 4–6 ve 7–10 aralıklarına göre quiz soruları (JSON formatında) oluşturur.
-    Sonuç olarak, video script ve quiz çıktısını döner.
+    Yerel vektör indeksinden ilk RETRIEVAL_TOP_K parçayı getirir.
+    Güven eşiğinin altındaysa (veya indeks kapalı/boşsa) None döner.
     """
-    knowledge_base_id = 'QALSFMRFUA'  # Gerçek KB ID’nizi girin
+    if not LOCAL_RETRIEVAL:
+        return None
+    try:
+        from local_retrieval import get_local_index
+        results = get_local_index().query(user_query, k=RETRIEVAL_TOP_K)
+    except Exception as err:
+        logger.warning(f"Yerel retrieval kullanılamadı, knowledge base’e geçiliyor: {err}")
+        return None
+    if len(results) < RETRIEVAL_TOP_K:
+        return None
+    mean_score = sum(score for score, _ in results) / len(results)
+    if mean_score < LOCAL_RETRIEVAL_MIN_SCORE:
+        logger.info(f"Yerel retrieval güveni düşük ({mean_score:.3f}); knowledge base’e geçiliyor.")
+        return None
+    logger.info(f"Yerel indeksten {len(results)} parça getirildi (ortalama skor {mean_score:.3f}).")
+    return [text for _, text in results]
+
+def _index_chunks(chunks):
+    try:
+        from local_retrieval import get_local_index
+        get_local_index().add(chunks)
+    except Exception as err:
+        logger.warning(f"Parçalar yerel indekse eklenemedi: {err}")
+
+def add_to_local_index(chunks):
+    """
+    Knowledge base’den gelen parçaları arka planda yerel indekse ekler; embedding
+    çağrıları script üretimini bekletmez, hata retrieval’ı bozmaz.
+    """
+    global _indexing_executor
+    if not LOCAL_RETRIEVAL or not chunks:
+        return
+    with _indexing_lock:
+        if _indexing_executor is None:
+            # Tek işçi: eklemeler sırayla yapılır, süreç kapanırken bekleyenler tamamlanır.
+            _indexing_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="local-index")
+    _indexing_executor.submit(_index_chunks, list(chunks))
+
+def retrieve_context(user_query):
+    """
+    Önce yerel vektör indeksine bakar; yeterince benzer parça yoksa soruyu hipotetik
+    bir belgeye dönüştürüp knowledge base’den ilgili parçaları getirir ve indekse ekler.
+    """
+    local_chunks = retrieve_from_local_index(user_query)
+    if local_chunks:
+        return local_chunks
+
     query_improve_prompt = (
         "Verilen soruyu analiz ederek retrieval sürecinde kullanılabilecek, "
         "konuyla ilgili anahtar noktaları, alt konuları ve detayları içeren, "
@@ -88,7 +142,19 @@ def get_video_script_and_quiz(user_query):
     )
     # İyileştirilmiş sorguyu ve hipotetik belgeyi üret
     improved_query = generate_response_with_llm(query_improve_prompt)
-    retrieved_chunks = retrieve_chunks_from_kb(improved_query, knowledge_base_id)
+    retrieved_chunks = retrieve_chunks_from_kb(improved_query, KNOWLEDGE_BASE_ID)
+    add_to_local_index(retrieved_chunks)
+    return retrieved_chunks
+
+def get_video_script_and_quiz_multi_call(user_query):
+    """
+    Kullanıcının sorusuna göre:
+    1. Knowledge base’den ilgili belgeleri getirir,
+    2. Konu özetini oluşturup 180 saniyelik video segmentleri üretir (video script JSON olarak),
+    3. Oluşan video scripti kullanarak; segmentleri 1–3, 4–6 ve 7–10 aralıklarına göre quiz soruları (JSON formatında) oluşturur.
+    Sonuç olarak, video script ve quiz çıktısını döner.
+    """
+    retrieved_chunks = retrieve_context(user_query)
 
     if retrieved_chunks:
         # Belirlenen parçalardan tek bir bağlam oluşturulur.
@@ -179,4 +245,212 @@ def get_video_script_and_quiz(user_query):
         response = generate_response_with_llm(user_query)
         print("\nGenerated Response:")
         print(response)
-        return None, None
\ No newline at end of file
+        return None, None
+
+class ScriptGenerationError(Exception):
+    """
+    Video script ve quiz şemaya uygun üretilemediğinde fırlatılır; böylece
+    ücretli video/TTS adımları hiç başlamadan iş sonlandırılır.
+    """
+
+
+SEGMENT_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "video_prompt": {"type": "string", "minLength": 1, "maxLength": VIDEO_PROMPT_MAX_LENGTH,
+                         "description": "İngilizce sahne tanımı (Nova Reel prompt’u)."},
+        "video_script": {"type": "string", "minLength": 1,
+                         "description": "Türkçe anlatım metni (text-to-speech)."},
+        "start_time": {"type": "number", "minimum": 0},
+        "end_time": {"type": "number", "minimum": 0},
+    },
+    "required": ["video_prompt", "video_script", "start_time", "end_time"],
+}
+
+QUESTION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "start_time": {"type": "number", "minimum": 0},
+        "end_time": {"type": "number", "minimum": 0},
+        "question": {"type": "string", "minLength": 1},
+        "options": {"type": "array", "items": {"type": "string"}, "minItems": 5, "maxItems": 5},
+        "answer": {"type": "string", "description": "options listesindeki doğru şıkkın birebir aynısı."},
+    },
+    "required": ["start_time", "end_time", "question", "options", "answer"],
+}
+
+VIDEO_PACKAGE_TOOL = {
+    "name": "submit_video_package",
+    "description": "180 saniyelik eğitim videosunun segmentlerini ve quiz sorularını kaydeder.",
+    "input_schema": {
+        "type": "object",
+        "properties": {
+            "video_script": {"type": "array", "items": SEGMENT_SCHEMA, "minItems": 1},
+            "quiz": {
+                "type": "object",
+                "properties": {
+                    "questions": {"type": "array", "items": QUESTION_SCHEMA, "minItems": 1},
+                },
+                "required": ["questions"],
+            },
+        },
+        "required": ["video_script", "quiz"],
+    },
+}
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def validate_video_script(segments):
+    """
+    Video script segmentlerini SEGMENT_SCHEMA’ya göre doğrular ve hata mesajlarının listesini döner.
+    """
+    if not isinstance(segments, list) or not segments:
+        return ["video_script boş olmayan bir liste olmalı."]
+    errors = []
+    for i, segment in enumerate(segments):
+        if not isinstance(segment, dict):
+            errors.append(f"video_script[{i}] bir nesne olmalı.")
+            continue
+        for key in ("video_prompt", "video_script"):
+            value = segment.get(key)
+            if not isinstance(value, str) or not value.strip():
+                errors.append(f"video_script[{i}].{key} boş olmayan bir metin olmalı.")
+        prompt = segment.get("video_prompt")
+        if isinstance(prompt, str) and len(prompt) > VIDEO_PROMPT_MAX_LENGTH:
+            errors.append(f"video_script[{i}].video_prompt en fazla {VIDEO_PROMPT_MAX_LENGTH} karakter olmalı.")
+        start, end = segment.get("start_time"), segment.get("end_time")
+        if not _is_number(start) or not _is_number(end):
+            errors.append(f"video_script[{i}] sayısal start_time ve end_time içermeli.")
+        elif end <= start:
+            errors.append(f"video_script[{i}].end_time start_time’dan büyük olmalı.")
+    return errors
+
+
+def validate_quiz(quiz):
+    """
+    Quiz’i {"questions": [...]} biçiminde QUESTION_SCHEMA’ya göre doğrular ve hata mesajlarının listesini döner.
+    """
+    questions = quiz.get("questions") if isinstance(quiz, dict) else None
+    if not isinstance(questions, list) or not questions:
+        return ["quiz.questions boş olmayan bir liste olmalı."]
+    errors = []
+    for i, question in enumerate(questions):
+        if not isinstance(question, dict):
+            errors.append(f"quiz.questions[{i}] bir nesne olmalı.")
+            continue
+        if not isinstance(question.get("question"), str) or not question["question"].strip():
+            errors.append(f"quiz.questions[{i}].question boş olmayan bir metin olmalı.")
+        options = question.get("options")
+        if not isinstance(options, list) or len(options) != 5 or not all(isinstance(o, str) for o in options):
+            errors.append(f"quiz.questions[{i}].options tam olarak 5 metin şık içermeli.")
+        elif question.get("answer") not in options:
+            errors.append(f"quiz.questions[{i}].answer şıklardan biriyle birebir aynı olmalı.")
+    return errors
+
+
+def validate_video_package(package):
+    """
+    Video script ve quiz’i VIDEO_PACKAGE_TOOL şemasına göre doğrular.
+    Hata mesajlarının listesini döner; liste boşsa paket geçerlidir.
+    """
+    if not isinstance(package, dict):
+        return ["Yanıt bir JSON nesnesi olmalı."]
+    return validate_video_script(package.get("video_script")) + validate_quiz(package.get("quiz"))
+
+
+def invoke_tool_with_llm(messages, tool, model_id='us.anthropic.claude-3-5-haiku-20241022-v1:0'):
+    """
+    Modeli verilen tool’u çağırmaya zorlar ve tool_use bloğunu döner.
+    """
+    bedrock_runtime = get_client(SERVICE_NAME, REGION_NAME)
+    body = json.dumps({
+        'anthropic_version': ANTHROPIC_VERSION,
+        'messages': messages,
+        'max_tokens': STRUCTURED_MAX_TOKENS,
+        'temperature': TEMPERATURE,
+        'tools': [tool],
+        'tool_choice': {'type': 'tool', 'name': tool['name']},
+    })
+    response = bedrock_runtime.invoke_model(body=body, modelId=model_id)
+    response_body = json.loads(response.get('body').read())
+    if response_body.get('stop_reason') == 'max_tokens':
+        # Yarıda kesilmiş tool girdisi düzeltme turunda da kesilir; tekrar denemek boşa maliyettir.
+        raise ScriptGenerationError(f"Model yanıtı {STRUCTURED_MAX_TOKENS} token sınırında kesildi.")
+    for block in response_body.get('content', []):
+        if block.get('type') == 'tool_use' and block.get('name') == tool['name']:
+            return block
+    raise ScriptGenerationError(f"Model {tool['name']} tool’unu çağırmadı (stop_reason={response_body.get('stop_reason')}).")
+
+
+def get_video_script_and_quiz_single_call(user_query):
+    """
+    Kullanıcının sorusuna göre knowledge base’den bağlamı getirir, ardından
+    video script ve quiz’i tek bir yapılandırılmış (tool-use) çağrıyla üretir.
+    Şemaya uymayan yanıtlar için modelden en fazla MAX_REPAIR_ATTEMPTS kez düzeltme ister.
+    """
+    retrieved_chunks = retrieve_context(user_query)
+    if not retrieved_chunks:
+        raise ScriptGenerationError("İlgili parça bulunamadı; video üretilmeyecek.")
+
+    context = "\n".join(retrieved_chunks)
+    prompt = (
+        "Ders kitabından alınan bağlamı kullanarak aşağıdaki soruyu açıklayan toplam 180 saniyelik bir eğitim videosu "
+        "ve bu videoya ait bir quiz hazırla. Sonucu yalnızca submit_video_package tool’u ile gönder.\n\n"
+        "Video segmentleri:\n"
+        "1. Toplam süre 180 saniye olacak şekilde, segment süreleri 10 ila 20 saniye arasında ayarlanmış ve ardışık zaman dilimlerine bölünmüş olsun.\n"
+        "2. Her segmentin başlangıç ve bitiş zamanları birbirine bitişik olmalı (bir segmentin end_time’ı bir sonrakinin start_time’ı olmalı).\n"
+        "3. \"video_prompt\": sahne tanımlamaları ve görsel detaylar içeren İngilizce prompt "
+        f"(en fazla {VIDEO_PROMPT_MAX_LENGTH} karakter).\n"
+        "4. \"video_script\": konunun temel kavramlarını açık, net, öğretici ve akıcı bir dille anlatan Türkçe metin.\n\n"
+        "Quiz:\n"
+        "İlk 3 segment, 4.–6. segmentler ve 7.–10. segmentler için birer tane olmak üzere 5 şıklı çoktan seçmeli sorular oluştur. "
+        "Her soru ilgili segmentlerin toplam başlangıç ve bitiş zamanlarını içermeli; \"answer\" doğru şıkkın birebir aynısı olmalı.\n\n"
+        f"Bağlam:\n{context}\n\n"
+        f"Soru:\n{user_query}"
+    )
+    messages = [{'role': 'user', 'content': prompt}]
+
+    for attempt in range(MAX_REPAIR_ATTEMPTS + 1):
+        try:
+            tool_call = invoke_tool_with_llm(messages, VIDEO_PACKAGE_TOOL)
+        except ClientError as err:
+            error_message = err.response["Error"]["Message"]
+            raise ScriptGenerationError(f"Model çağrısı sırasında client hatası oluştu: {error_message}") from err
+        package = tool_call.get('input')
+        errors = validate_video_package(package)
+        if not errors:
+            return package["video_script"], package["quiz"]
+
+        logger.warning(f"Video paketi şemaya uymuyor (deneme {attempt + 1}): {errors}")
+        # Düzeltme turu: hataları tool_result olarak modele geri ver.
+        messages = messages + [
+            {'role': 'assistant', 'content': [tool_call]},
+            {'role': 'user', 'content': [{
+                'type': 'tool_result',
+                'tool_use_id': tool_call['id'],
+                'is_error': True,
+                'content': "Şema hataları:\n- " + "\n- ".join(errors) + "\nLütfen düzeltilmiş paketi tekrar gönder.",
+            }]},
+        ]
+
+    raise ScriptGenerationError(f"Video paketi {MAX_REPAIR_ATTEMPTS + 1} denemede doğrulanamadı: {errors}")
+
+
+def get_video_script_and_quiz(user_query):
+    """
+    SCRIPT_GENERATION_MODE’a göre video script ve quiz’i üretir ve (video_script, quiz) döner.
+    Her iki modda da sonuç, ücretli adımlara geçmeden önce şemaya göre doğrulanır.
+    """
+    if SCRIPT_GENERATION_MODE == "multi":
+        video_script, quiz = get_video_script_and_quiz_multi_call(user_query)
+        # Eski akışın quiz’i serbest biçimli olabildiğinden yalnızca boş olmaması aranır.
+        errors = validate_video_script(video_script)
+        if not quiz:
+            errors.append("quiz boş.")
+        if errors:
+            raise ScriptGenerationError(f"Video paketi doğrulanamadı: {errors}")
+        return video_script, quiz
+    return get_video_script_and_quiz_single_call(user_query)